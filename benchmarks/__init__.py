@@ -0,0 +1,4 @@
+"""
+Benchmarks for leanblueprint. They are not part of the installed package.
+Each module can be run with `python -m benchmarks.<module> --help`.
+"""
@@ -0,0 +1,299 @@
+"""
+Benchmark the web build of synthetic blueprints.
+
+A blueprint is generated with the requested numbers of chapters, statements,
+`\\uses` edges and `\\lean` declarations, then the plasTeX pipeline runs on it
+with the blueprint package loaded. The time and peak memory of each phase is
+written as JSON, so that results can be compared across releases.
+
+Phases are the parsing, each post-parse callback (including `make_lean_data`
+and `make_legend`), node colorizing and the rendering. Colorizing happens both
+in callbacks caching graphs and during rendering, its time is excluded from
+theirs. The rendering is further split into file writing and the remaining
+template rendering; memory is not measured for colorizing and those two since
+they are interleaved with other phases.
+Memory is measured using tracemalloc, which slows down the build. Use
+`--no-memory` for more accurate timings.
+"""
+import argparse
+import builtins
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from leanblueprint.cache import package_versions
+
+PLASTEX_CFG = """\
+[general]
+renderer=HTML5
+plugins=plastexdepgraph leanblueprint
+
+[document]
+toc-depth=3
+toc-non-files=True
+
+[files]
+directory=../web/
+split-level=0
+
+[html5]
+localtoc-level=0
+mathjax-dollars=False
+
+[images]
+imager=none
+vector-imager=none
+"""
+
+PREAMBLE = r"""\documentclass{report}
+\usepackage{amssymb, amsthm, amsmath}
+\usepackage{hyperref}
+\usepackage[dep_by=chapter]{blueprint}
+
+\newtheorem{theorem}{Theorem}[chapter]
+\newtheorem{lemma}[theorem]{Lemma}
+\theoremstyle{definition}
+\newtheorem{definition}[theorem]{Definition}
+
+\home{https://example.com/blueprint}
+\github{https://github.com/example/project}
+\dochome{https://example.com/docs}
+
+\title{Synthetic blueprint}
+\begin{document}
+\maketitle
+"""
+
+
+def generate(src: Path, chapters: int, statements: int, uses: int, decls: int,
+             leanok: float, mathlibok: float, seed: int = 0) -> None:
+    """
+    Write a synthetic blueprint in the folder src. Statements are spread
+    evenly among chapters, each one uses about `uses` earlier statements
+    and mentions `decls` Lean declarations. A fraction leanok of
+    statements and proofs are marked as formalized, and a fraction
+    mathlibok of statements as being in Mathlib.
+    """
+    rng = random.Random(seed)
+    src.mkdir(parents=True, exist_ok=True)
+    (src/'plastex.cfg').write_text(PLASTEX_CFG)
+    lines = [PREAMBLE]
+    for i in range(statements):
+        if i*chapters % statements < chapters:
+            lines.append(f'\\chapter{{Chapter {i*chapters//statements + 1}}}\n')
+        env = 'definition' if rng.random() < 0.2 else rng.choice(['lemma', 'theorem'])
+        lines.append(f'\\begin{{{env}}}\\label{{thm:{i}}}')
+        used = rng.sample(range(i), min(i, uses))
+        if used:
+            lines.append('\\uses{' + ', '.join(f'thm:{j}' for j in used) + '}')
+        if decls:
+            lines.append('\\lean{' + ', '.join(f'Synthetic.decl_{i}_{j}' for j in range(decls)) + '}')
+        if rng.random() < mathlibok:
+            lines.append('\\mathlibok')
+        elif rng.random() < leanok:
+            lines.append('\\leanok')
+        lines.append(f'Statement number {i}, with some math $x_{{{i}}} + 1 = y$.')
+        lines.append(f'\\end{{{env}}}\n')
+        if env != 'definition':
+            lines.append('\\begin{proof}')
+            if rng.random() < leanok:
+                lines.append('\\leanok')
+            lines.append('Obvious.')
+            lines.append('\\end{proof}\n')
+    lines.append('\\end{document}\n')
+    (src/'web.tex').write_text('\n'.join(lines))
+
+
+class Phases:
+    """Record the time and peak memory of build phases."""
+
+    def __init__(self, memory: bool) -> None:
+        self.memory = memory
+        self.results: Dict[str, Dict[str, Any]] = dict()
+
+    def seconds(self, name: str) -> float:
+        """Return the time recorded so far for the phase name."""
+        return self.results.get(name, {}).get('seconds', 0.0)
+
+    @contextmanager
+    def measure(self, name: str, exclude: Iterable[str] = ()) -> Iterator[None]:
+        """Measure the phase name, excluding the time of the phases in exclude."""
+        exclude = list(exclude)
+        if self.memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        excluded = sum(self.seconds(other) for other in exclude)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            excluded = sum(self.seconds(other) for other in exclude) - excluded
+            self.add(name, time.perf_counter() - start - excluded,
+                     tracemalloc.get_traced_memory()[1] if self.memory else None)
+
+    def add(self, name: str, seconds: float, peak_memory: Optional[int] = None) -> None:
+        result = self.results.setdefault(name, {'seconds': 0.0, 'peak_memory': None})
+        result['seconds'] += seconds
+        if peak_memory is not None:
+            result['peak_memory'] = max(result['peak_memory'] or 0, peak_memory)
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """Return a version of func whose running time is added to the phase name."""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        wrapper.__name__ = func.__name__
+        return wrapper
+
+
+class TimedFile:
+    """
+    A file whose opening, reading, writing and closing time is added to
+    the writing phase.
+    """
+
+    def __init__(self, phases: Phases, *args, **kwargs) -> None:
+        self.phases = phases
+        self.file = phases.timed('writing', builtins.open)(*args, **kwargs)
+        self.read = phases.timed('writing', self.file.read)
+        self.write = phases.timed('writing', self.file.write)
+
+    def close(self) -> None:
+        self.phases.timed('writing', self.file.close)()
+
+    def __enter__(self) -> 'TimedFile':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def build(src: Path, phases: Phases) -> None:
+    """Build the web version of the blueprint in src, recording phases."""
+    import plasTeX
+    import plasTeX.Renderers
+    from plasTeX.Compile import load_renderer
+    from plasTeX.Config import defaultConfig
+    from plasTeX.TeX import TeX
+    from plasTeX.client import collect_renderer_config
+
+    from leanblueprint.rendering import render_stats, reset_render_stats
+
+    config = defaultConfig()
+    collect_renderer_config(config)
+    config.read([str(src/'plastex.cfg')])
+    cwd = os.getcwd()
+    os.chdir(src)
+    try:
+        document = plasTeX.TeXDocument(config=config)
+        # Post-parse callbacks are kept aside to be measured separately
+        # instead of being run at the end of parsing.
+        callbacks: Dict[int, List[Callable[[], None]]] = dict()
+
+        def add_callbacks(order: int, *funcs: Callable[[], None]) -> None:
+            callbacks.setdefault(order, []).extend(funcs)
+
+        document.addPostParseCallbacks = add_callbacks  # type: ignore
+        with phases.measure('parse'):
+            tex = TeX(document, file='web.tex')
+            document.userdata['jobname'] = tex.jobname
+            document.userdata['working-dir'] = os.getcwd()
+            tex.parse()
+        # The colorizers are installed while parsing and used by callbacks
+        # caching graphs as well as during rendering.
+        dep_graph = document.userdata['dep_graph']
+        for key in ['colorizer', 'fillcolorizer']:
+            dep_graph[key] = phases.timed('colorizing', dep_graph[key])
+        for _, funcs in sorted(callbacks.items()):
+            for func in funcs:
+                with phases.measure(func.__name__, exclude=['colorizing']):
+                    func()
+
+        plasTeX.Renderers.open = partial(TimedFile, phases)  # type: ignore
+        renderer = load_renderer(config['general']['renderer'], config)
+        outdir = Path(config['files']['directory'])
+        outdir.mkdir(parents=True, exist_ok=True)
+        os.chdir(outdir)
+        reset_render_stats()
+        with phases.measure('rendering', exclude=['colorizing']):
+            renderer.render(document)
+        phases.results['template rendering'] = {
+            'seconds': phases.seconds('rendering') - phases.seconds('writing'),
+            'peak_memory': None}
+        phases.results['leanblueprint templates'] = render_stats()  # type: ignore
+    finally:
+        del plasTeX.Renderers.open  # type: ignore
+        os.chdir(cwd)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=10)
+    parser.add_argument('--statements', type=int, default=500)
+    parser.add_argument('--uses', type=int, default=3,
+                        help='Number of statements used by each statement.')
+    parser.add_argument('--decls', type=int, default=1,
+                        help='Number of Lean declarations of each statement.')
+    parser.add_argument('--leanok', type=float, default=0.5,
+                        help='Fraction of statements and proofs which are formalized.')
+    parser.add_argument('--mathlibok', type=float, default=0.1,
+                        help='Fraction of statements which are in Mathlib.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Do not measure memory, for more accurate timings.')
+    parser.add_argument('--keep', type=Path,
+                        help='Folder where the blueprint is generated and built, '
+                        'instead of a temporary folder.')
+    parser.add_argument('--output', '-o', type=Path,
+                        help='JSON file receiving results, instead of standard output.')
+    args = parser.parse_args(argv)
+
+    parameters = {name: getattr(args, name) for name in
+                  ['chapters', 'statements', 'uses', 'decls', 'leanok', 'mathlibok', 'seed']}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.keep or Path(tmp)
+        src = root/'src'
+        generate(src, **parameters)
+        phases = Phases(args.memory)
+        if args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        build(src.resolve(), phases)
+        total = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+        tracemalloc.stop()
+
+    results = {
+        'parameters': parameters,
+        'versions': dict(package_versions('leanblueprint', 'plasTeX', 'plastexdepgraph'),
+                         python=platform.python_version()),
+        'memory': args.memory,
+        'total': {'seconds': total, 'peak_memory': peak},
+        'phases': phases.results,
+    }
+    text = json.dumps(results, indent=1)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    for name, result in phases.results.items():
+        if 'seconds' in result:
+            memory = result['peak_memory']
+            print(f"{name:>30} {result['seconds']:8.3f}s" +
+                  (f" {memory/2**20:8.1f}MiB" if memory else ''), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
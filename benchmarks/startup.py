@@ -0,0 +1,84 @@
+"""
+Check the startup time of the leanblueprint command line client.
+
+The client is run a few times with each of the given arguments (by default
+`--version` and `--help`), and its median wall time in excess of a bare Python
+startup is compared to a budget. The script also checks that importing the
+client does not import modules which are only needed by some commands. It
+exits with a non-zero status if the budget is exceeded or if such a module is
+imported, so that it can be used as a regression check in continuous
+integration. Results are written as JSON.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Modules which should only be imported by the commands using them.
+LAZY_MODULES = ['git', 'jinja2', 'tomlkit', 'http.server', 'importlib.metadata',
+                'concurrent.futures', 'multiprocessing', 'rich.prompt', 'rich.table',
+                'leanblueprint.tasks', 'leanblueprint.server', 'leanblueprint.watch',
+                'leanblueprint.profiling']
+
+
+def wall_time(args: List[str], runs: int) -> float:
+    """Return the median wall time of running args, in seconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def eager_modules() -> List[str]:
+    """Return the modules of LAZY_MODULES imported when importing the client."""
+    code = ('import sys, json, leanblueprint.client; '
+            f'print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))')
+    result = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('arguments', nargs='*', default=['--version', '--help'],
+                        help='Arguments given to the client, each one in a separate run.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=0.25,
+                        help='Maximal startup time in excess of a bare Python startup, in seconds.')
+    parser.add_argument('--output', '-o', help='JSON file receiving results, '
+                        'instead of standard output.')
+    args = parser.parse_args(argv)
+
+    baseline = wall_time([sys.executable, '-c', 'pass'], args.runs)
+    times: Dict[str, float] = {
+        argument: wall_time([sys.executable, '-m', 'leanblueprint.client', argument],
+                            args.runs) - baseline
+        for argument in args.arguments}
+    eager = eager_modules()
+    results = {'python': baseline, 'client': times, 'budget': args.budget,
+               'eager_modules': eager}
+    text = json.dumps(results, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    failures = [f'leanblueprint {argument} takes {seconds:.3f}s more than Python startup'
+                for argument, seconds in times.items() if seconds > args.budget]
+    if eager:
+        failures.append(f"Importing the client imports {', '.join(eager)}")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark the status propagation pass on random dependency graphs.
+
+The time per node and edge should stay roughly constant when the graph grows,
+since the pass is linear in the number of nodes and edges.
+"""
+import argparse
+import random
+import time
+from typing import Any, List, Set, Tuple
+
+from leanblueprint.status import propagate_status
+
+
+class FakeNode:
+    """A stand-in for plasTeX nodes, carrying only what the status pass reads."""
+
+    def __init__(self, index: int):
+        self.id = f'node:{index}'
+        self.userdata: dict = dict()
+
+
+def random_dag(size: int, degree: int, seed: int = 0) -> Tuple[List[FakeNode], Set[Tuple[Any, Any]]]:
+    """
+    Build a random DAG with `size` nodes where each node uses about `degree`
+    earlier nodes. About half the nodes are stated in Lean, and about half
+    of those have a formalized proof.
+    """
+    rng = random.Random(seed)
+    nodes = [FakeNode(i) for i in range(size)]
+    edges = set()
+    for i, node in enumerate(nodes):
+        node.userdata['leanok'] = rng.random() < 0.5
+        used = rng.sample(nodes[:i], min(i, degree))
+        node.userdata['uses'] = used
+        edges.update((thm, node) for thm in used)
+        if rng.random() < 0.7:
+            proof = FakeNode(-i)
+            proof.userdata['leanok'] = node.userdata['leanok'] and rng.random() < 0.5
+            proof.userdata['uses'] = []
+            node.userdata['proved_by'] = proof
+    return nodes, edges
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 2000, 4000, 8000, 16000, 32000])
+    parser.add_argument('--degree', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'edges':>8} {'time (ms)':>10} {'ns per item':>12}")
+    for size in args.sizes:
+        nodes, edges = random_dag(size, args.degree)
+        best = min(timed(nodes, edges) for _ in range(args.repeat))
+        per_item = 1e9*best/(len(nodes) + len(edges))
+        print(f'{len(nodes):>8} {len(edges):>8} {1e3*best:>10.1f} {per_item:>12.0f}')
+
+
+def timed(nodes: List[FakeNode], edges: Set[Tuple[Any, Any]]) -> float:
+    start = time.perf_counter()
+    propagate_status(nodes, edges, lambda node: False)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
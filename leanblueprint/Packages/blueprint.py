@@ -9,22 +9,75 @@ Options:
 
 * showmore: enable buttons showing or hiding proofs (this requires the showmore plugin).
 
+* localdocs: path (relative to the blueprint sources folder) of the output
+  folder of doc-gen4, for instance localdocs=../../.lake/build/doc.
+  Lean declarations documented there are linked directly to their
+  documentation page instead of going through the doc-gen4 find page.
+
+* graphjobs: number of processes used to compute dependency graphs when
+  there are several of them (for instance with dep_by=chapter). The default
+  is the number of processors, use graphjobs=1 to disable parallelism.
+
+* jsongraph: write dependency graphs as compact JSON files, laid out during
+  the build, displayed by a lightweight viewer which fetches the statement of
+  a node when it is clicked. This is meant for large blueprints whose
+  dependency graph pages are too slow to display.
+
+* neighborhood: give each node of the dependency graph its own small graph
+  page, showing the nodes it uses and the nodes using it up to the given
+  number of steps (1 if no number is given), linked from its statement.
+
+* renderjobs: number of processes rendering the pages of chapters (the
+  default when no number is given is the number of processors). The document
+  is still parsed in a single process. This is not available on Windows.
+
 You can also add options that will be passed to the dependency graph package.
 """
+import atexit
+import os
 import string
+import time
 from pathlib import Path
+from typing import Callable, List
 
-from jinja2 import Template
 from plasTeX import Command
 from plasTeX.Logging import getLogger
-from plasTeX.PackageResource import PackageCss, PackageTemplateDir
+from plasTeX.PackageResource import (PackageCss, PackageJs,
+                                     PackagePreCleanupCB, PackageTemplateDir)
 from plastexdepgraph.Packages.depgraph import item_kind
 
+from leanblueprint import parallel_pages, profiling
+from leanblueprint.cache import DiskCache, write_if_changed
+from leanblueprint.content_cache import share_contents
+from leanblueprint.decls import DeclIndex
+from leanblueprint.docgen import DECLARATION_DATA, DocIndex, load_doc_index
+from leanblueprint.graph_cache import (GRAPH_CACHE_SIZE, cache_graph,
+                                      prefetch_graphs)
+from leanblueprint.graph_json import graph_name, write_graph_json
+from leanblueprint.neighborhoods import (NEIGHBORHOOD_LINK_TPL,
+                                         neighborhood_graphs, page_names,
+                                         write_neighborhood_pages)
+from leanblueprint.progress import PROGRESS_FILE, Progress
+from leanblueprint.rendering import add_template, render_stats
+from leanblueprint.status import (STATUS_COUNT, NodeStatus, graph_union,
+                                  propagate_status)
+from leanblueprint.status_update import CHECKMARK_TPL, write_snapshot
+
 log = getLogger()
 
 PKG_DIR = Path(__file__).parent
 STATIC_DIR = Path(__file__).parent.parent/'static'
 
+# Cache of the index of the local Lean documentation, in the blueprint folder.
+DOC_INDEX_CACHE = '.doc_index_cache.json'
+
+# Path of the declaration data of the local Lean documentation, in the
+# blueprint folder, so that the client rebuilds when this data changes.
+DOC_DATA_RECORD = '.doc_data_path'
+
+# Cache of dependency graphs, in the blueprint folder.
+DEP_GRAPH_CACHE = '.dep_graph_cache'
+
 
 class home(Command):
     r"""\home{url}"""
@@ -106,6 +159,8 @@ class lean(Command):
         self.parentNode.setUserData('leandecls', decls)
         all_decls = self.ownerDocument.userdata.setdefault('lean_decls', [])
         all_decls.extend(decls)
+        self.ownerDocument.userdata.setdefault('lean_decl_nodes', []).append(
+            (self.parentNode, decls))
 
 
 class discussion(Command):
@@ -118,13 +173,7 @@ class discussion(Command):
             'issue', self.attributes['issue'].lstrip('#').strip())
 
 
-CHECKMARK_TPL = Template("""
-    {% if obj.userdata.leanok and ('proved_by' not in obj.userdata or obj.userdata.proved_by.userdata.leanok ) %}
-    ✓
-    {% endif %}
-""")
-
-LEAN_DECLS_TPL = Template("""
+LEAN_DECLS_TPL = add_template('lean_decls', """
     {% if obj.userdata.leandecls %}
     <button class="modal lean">L∃∀N</button>
     {% call modal('Lean declarations') %}
@@ -137,13 +186,13 @@ LEAN_DECLS_TPL = Template("""
     {% endif %}
 """)
 
-GITHUB_ISSUE_TPL = Template("""
+GITHUB_ISSUE_TPL = add_template('github_issue', """
     {% if obj.userdata.issue %}
     <a class="github_link" href="{{ obj.ownerDocument.userdata.project_github }}/issues/{{ obj.userdata.issue }}">Discussion</a>
     {% endif %}
 """)
 
-LEAN_LINKS_TPL = Template("""
+LEAN_LINKS_TPL = add_template('lean_links', """
   {% if thm.userdata['lean_urls'] -%}
     {%- if thm.userdata['lean_urls']|length > 1 -%}
   <div class="tooltip">
@@ -160,16 +209,95 @@ LEAN_LINKS_TPL = Template("""
     {%- endif -%}
 """)
 
-GITHUB_LINK_TPL = Template("""
+GITHUB_LINK_TPL = add_template('github_link', """
   {% if thm.userdata['issue'] -%}
   <a class="issue_link" href="{{ document.userdata['project_github'] }}/issues/{{ thm.userdata['issue'] }}">Discussion</a>
   {%- endif -%}
 """)
 
 
+def profile_document(document, profiler: profiling.Profiler) -> None:
+    """
+    Record the build stages of document: parsing, post-parse callbacks,
+    page rendering, dependency graph generation, pre-cleanup callbacks
+    and the final cleanup, whose trace event also holds the render statistics
+    of the templates of this package. This must be called before other
+    packages register their callbacks.
+    """
+    marks = {'parse': time.time()}
+    add_callbacks = document.addPostParseCallbacks
+
+    def profiled(order: int, callback: Callable[[], None]) -> Callable[[], None]:
+        def run() -> None:
+            if 'post-parse' not in marks:
+                marks['post-parse'] = time.time()
+                profiler.add('parse', 'plastex', marks['parse'], marks['post-parse'])
+            with profiler.stage(callback.__name__, 'post-parse', priority=order):
+                callback()
+            marks['render'] = time.time()
+        return run
+
+    def add_profiled_callbacks(order: int, *callbacks: Callable[[], None]) -> None:
+        add_callbacks(order, *[profiled(order, callback) for callback in callbacks])
+
+    document.addPostParseCallbacks = add_profiled_callbacks
+
+    def end_rendering(document) -> List[str]:
+        marks['pre-cleanup'] = time.time()
+        profiler.add('page rendering', 'plastex', marks.get('render', marks['parse']),
+                     marks['pre-cleanup'])
+        return []
+
+    # Pre-cleanup callbacks run in registration order, this one first.
+    document.addPackageResource(PackagePreCleanupCB(data=end_rendering))
+
+    def end_pre_cleanup(document) -> List[str]:
+        marks['cleanup'] = time.time()
+        profiler.add('pre-cleanup callbacks', 'plastex', marks['pre-cleanup'], marks['cleanup'])
+        return []
+
+    def profile_graph(name: str, graph) -> None:
+        to_dot = graph.to_dot
+
+        def profiled_to_dot(*args, **kwargs):
+            with profiler.stage(f'dependency graph {name}', 'graph'):
+                dot = to_dot(*args, **kwargs)
+            tred = dot.tred
+
+            def profiled_tred(*args, **kwargs):
+                with profiler.stage(f'transitive reduction {name}', 'graph'):
+                    return tred(*args, **kwargs)
+            dot.tred = profiled_tred
+            return dot
+        graph.to_dot = profiled_to_dot
+
+    def profile_graphs() -> None:
+        """
+        Instrument dependency graphs, built by depgraph at priority 110, and
+        register the pre-cleanup callback running after those of other packages.
+        """
+        for section, graph in document.userdata['dep_graph']['graphs'].items():
+            profile_graph('document' if section == document else section.id, graph)
+        document.addPackageResource(PackagePreCleanupCB(data=end_pre_cleanup))
+
+    add_callbacks(111, profile_graphs)
+
+    def end_cleanup() -> None:
+        if 'cleanup' in marks:
+            profiler.add('cleanup', 'plastex', marks['cleanup'], time.time(),
+                         templates=render_stats())
+
+    # Exit handlers run in reverse order, this one before writing the events.
+    atexit.register(end_cleanup)
+
+
 def ProcessOptions(options, document):
     """This is called when the package is loaded."""
 
+    profiler = profiling.from_environment('plastex')
+    if profiler is not None:
+        profile_document(document, profiler)
+
     # We want to ensure the depgraph and showmore packages are loaded.
     # We first need to make sure the corresponding plugins are used.
     # This is a bit hacky but needed for backward compatibility with
@@ -178,6 +306,8 @@ def ProcessOptions(options, document):
     plugins = document.config['general'].data['plugins'].value
     if 'plastexdepgraph' not in plugins:
         plugins.append('plastexdepgraph')
+    if 'jsongraph' in options:
+        options.setdefault('tpl', str(STATIC_DIR/'dep_graph_json.html'))
     # And now load the package.
     document.context.loadPythonPackage(document, 'depgraph', options)
     if 'showmore' in options:
@@ -189,6 +319,14 @@ def ProcessOptions(options, document):
     templatedir = PackageTemplateDir(path=PKG_DIR/'renderer_templates')
     document.addPackageResource(templatedir)
 
+    if 'renderjobs' in options:
+        jobs = options['renderjobs']
+        jobs = (os.cpu_count() or 1) if jobs is True else int(jobs)
+        if parallel_pages.available():
+            document.addPackageResource(parallel_pages.ParallelPages(jobs))
+        else:
+            log.warning('The renderjobs option is not available on this platform.')
+
     jobname = document.userdata['jobname']
     outdir = document.config['files']['directory']
     outdir = string.Template(outdir).substitute({'jobname': jobname})
@@ -196,48 +334,68 @@ def ProcessOptions(options, document):
     def make_lean_data() -> None:
         """
         Build url and formalization status for nodes in the dependency graphs.
-        Also create the file lean_decls of all Lean names referred to in the blueprint.
+        Also create the file lean_decls of all Lean names referred to in the blueprint,
+        and the index lean_decls.json of nodes mentioning each of them.
         """
 
         project_dochome = document.userdata.get('project_dochome',
                                                 'https://leanprover-community.github.io/mathlib4_docs')
 
-        for graph in document.userdata['dep_graph']['graphs'].values():
-            nodes = graph.nodes
-            for node in nodes:
-                leandecls = node.userdata.get('leandecls', [])
-                lean_urls = []
-                for leandecl in leandecls:
-                    lean_urls.append(
-                        (leandecl,
-                         f'{project_dochome}/find/#doc/{leandecl}'))
-
-                node.userdata['lean_urls'] = lean_urls
-
-                used = node.userdata.get('uses', [])
-                node.userdata['can_state'] = all(thm.userdata.get('leanok')
-                                                 for thm in used) and not node.userdata.get('notready', False)
-                proof = node.userdata.get('proved_by')
-                if proof:
-                    used.extend(proof.userdata.get('uses', []))
-                    node.userdata['can_prove'] = all(thm.userdata.get('leanok')
-                                                     for thm in used)
-                    node.userdata['proved'] = proof.userdata.get(
-                        'leanok', False)
-                else:
-                    node.userdata['can_prove'] = False
-                    node.userdata['proved'] = False
-
-            for node in nodes:
-                node.userdata['fully_proved'] = all(n.userdata.get('proved', False) or item_kind(
-                    n) == 'definition' for n in graph.ancestors(node).union({node}))
-
-        lean_decls_path = Path(document.userdata['working-dir']).parent/"lean_decls"
-        lean_decls_path.write_text("\n".join(document.userdata.get("lean_decls", [])))
+        working_dir = Path(document.userdata['working-dir'])
+        record_path = working_dir.parent/DOC_DATA_RECORD
+        if 'localdocs' in options:
+            doc_dir = working_dir/options['localdocs']
+            write_if_changed(record_path, str((doc_dir/DECLARATION_DATA).resolve()))
+            doc_index = load_doc_index(doc_dir, working_dir.parent/DOC_INDEX_CACHE)
+        else:
+            if record_path.exists():
+                record_path.unlink()
+            doc_index = DocIndex([], {})
+
+        nodes, edges = graph_union(document.userdata['dep_graph']['graphs'].values())
+        for node in nodes:
+            leandecls = node.userdata.get('leandecls', [])
+            lean_urls = []
+            for leandecl in leandecls:
+                lean_urls.append(
+                    (leandecl,
+                     doc_index.url(project_dochome, leandecl) or
+                     f'{project_dochome}/find/#doc/{leandecl}'))
+
+            node.userdata['lean_urls'] = lean_urls
+
+        progress = document.userdata['progress'] = Progress(item_kind)
+        propagate_status(nodes, edges,
+                         lambda node: item_kind(node) == 'definition',
+                         progress.add)
+
+        if 'neighborhood' in options:
+            neighborhoods = neighborhood_graphs(document,
+                                                document.userdata['dep_graph']['graphs'].values(),
+                                                int(options['neighborhood']))
+            for node, name in page_names(neighborhoods).items():
+                node.userdata['neighborhood_url'] = name
+            document.userdata['dep_graph']['neighborhoods'] = neighborhoods
+
+        lean_decls_path = working_dir.parent/"lean_decls"
+        write_if_changed(lean_decls_path, "\n".join(document.userdata.get("lean_decls", [])))
+        index = DeclIndex.from_pairs((decl, node.id)
+                                     for node, decls in document.userdata.get('lean_decl_nodes', [])
+                                     for decl in decls)
+        write_if_changed(lean_decls_path.with_name("lean_decls.json"), index.dumps())
 
     document.addPostParseCallbacks(150, make_lean_data)
 
-    document.addPackageResource([PackageCss(path=STATIC_DIR/'blueprint.css')])
+    def make_progress(document) -> List[str]:
+        """
+        Write the formalization progress statistics gathered during the
+        status pass in the output folder.
+        """
+        write_if_changed(Path(PROGRESS_FILE), document.userdata['progress'].dumps())
+        return [PROGRESS_FILE]
+
+    document.addPackageResource([PackageCss(path=STATIC_DIR/'blueprint.css'),
+                                 PackagePreCleanupCB(data=make_progress)])
 
     colors = document.userdata['dep_graph']['colors'] = {
         'mathlib': ('darkgreen', 'Dark green'),
@@ -250,45 +408,140 @@ def ProcessOptions(options, document):
         'fully_proved': ('#1CAC78', 'Dark green')
     }
 
-    def colorizer(node) -> str:
-        data = node.userdata
-
+    def border_color(status: NodeStatus) -> str:
         color = ''
-        if data.get('mathlibok'):
+        if status & NodeStatus.MATHLIB:
             color = colors['mathlib'][0]
-        elif data.get('leanok'):
+        elif status & NodeStatus.STATED:
             color = colors['stated'][0]
-        elif data.get('can_state'):
+        elif status & NodeStatus.CAN_STATE:
             color = colors['can_state'][0]
-        elif data.get('notready'):
+        elif status & NodeStatus.NOT_READY:
             color = colors['not_ready'][0]
         return color
 
-    def fillcolorizer(node) -> str:
-        data = node.userdata
-        stated = data.get('leanok')
-        can_state = data.get('can_state')
-        can_prove = data.get('can_prove')
-        proved = data.get('proved')
-        fully_proved = data.get('fully_proved')
+    def fill_color(status: NodeStatus) -> str:
+        stated = status & NodeStatus.STATED
+        can_state = status & NodeStatus.CAN_STATE
 
         fillcolor = ''
-        if proved:
+        if status & NodeStatus.PROVED:
             fillcolor = colors['proved'][0]
-        elif can_prove and (can_state or stated):
+        elif status & NodeStatus.CAN_PROVE and (can_state or stated):
             fillcolor = colors['can_prove'][0]
-        if item_kind(node) == 'definition':
+        if status & NodeStatus.DEFINITION:
             if stated:
                 fillcolor = colors['defined'][0]
             elif can_state:
                 fillcolor = colors['can_prove'][0]
-        elif fully_proved:
+        elif status & NodeStatus.FULLY_PROVED:
             fillcolor = colors['fully_proved'][0]
         return fillcolor
 
+    # Border and fill colors indexed by node status, see make_color_tables.
+    border_colors: List[str] = []
+    fill_colors: List[str] = []
+
+    def make_color_tables() -> None:
+        """
+        Compute the border and fill colors for every possible node status.
+        This is a post-parse callback so that colors set by \\graphcolor
+        are taken into account.
+        """
+        statuses = [NodeStatus(bits) for bits in range(STATUS_COUNT)]
+        border_colors[:] = map(border_color, statuses)
+        fill_colors[:] = map(fill_color, statuses)
+
+    document.addPostParseCallbacks(150, make_color_tables)
+
+    def colorizer(node) -> str:
+        return border_colors[node.userdata.get('status', 0)]
+
+    def fillcolorizer(node) -> str:
+        return fill_colors[node.userdata.get('status', 0)]
+
     document.userdata['dep_graph']['colorizer'] = colorizer
     document.userdata['dep_graph']['fillcolorizer'] = fillcolorizer
 
+    def make_status_snapshot(document) -> List[str]:
+        """
+        Record what the client needs to update statuses without running
+        plasTeX when only status markers change, see leanblueprint.status_update.
+        """
+        write_snapshot(document, border_colors, fill_colors)
+        return []
+
+    document.addPackageResource(PackagePreCleanupCB(data=make_status_snapshot))
+
+    def dep_graph_cache() -> DiskCache:
+        return DiskCache(Path(document.userdata['working-dir']).parent/DEP_GRAPH_CACHE,
+                         GRAPH_CACHE_SIZE)
+
+    def cache_graphs() -> None:
+        """
+        Reuse the Graphviz source of dependency graphs from previous builds
+        when their structure and colors did not change.
+        """
+        cache = dep_graph_cache()
+        dep_graph = document.userdata['dep_graph']
+        for graph in [*dep_graph['graphs'].values(),
+                      *dep_graph.get('neighborhoods', {}).values()]:
+            cache_graph(graph, dep_graph, cache)
+
+    document.addPostParseCallbacks(150, cache_graphs)
+
+    def share_statement_contents() -> None:
+        """
+        Render the content of each dependency graph node once, for its page
+        and all the graph modals showing it.
+        """
+        nodes, _ = graph_union(document.userdata['dep_graph']['graphs'].values())
+        share_contents(document, nodes)
+
+    document.addPostParseCallbacks(150, share_statement_contents)
+
+    def prefetch_dep_graphs() -> None:
+        """
+        Compute the Graphviz sources of dependency graphs in parallel, using
+        as many processes as the graphjobs option (by default the number of
+        processors).
+        """
+        jobs = int(options.get('graphjobs', os.cpu_count() or 1))
+        dep_graph = document.userdata['dep_graph']
+        prefetch_graphs([*dep_graph['graphs'].values(),
+                         *dep_graph.get('neighborhoods', {}).values()],
+                        dep_graph.get('shapes', {'definition': 'box'}),
+                        not options.get('nonreducedgraph', False), jobs)
+
+    # This runs after all callbacks which could change colors.
+    document.addPostParseCallbacks(200, prefetch_dep_graphs)
+
+    if 'jsongraph' in options:
+        def name_json_graphs() -> None:
+            """Tell the viewer template where to find the data of each graph."""
+            for section, graph in document.userdata['dep_graph']['graphs'].items():
+                graph.json_name = 'dep_graph_' + graph_name(document, section)
+
+        document.addPostParseCallbacks(150, name_json_graphs)
+
+        def make_graph_json(document) -> List[str]:
+            return write_graph_json(document, document.userdata['dep_graph'],
+                                    not options.get('nonreducedgraph', False),
+                                    dep_graph_cache())
+
+        document.addPackageResource([
+            PackagePreCleanupCB(data=make_graph_json),
+            PackageJs(path=STATIC_DIR/'dep_graph_json.js', copy_only=True)])
+
+    if 'neighborhood' in options:
+        def make_neighborhood_pages(document) -> List[str]:
+            return write_neighborhood_pages(
+                document, document.userdata['dep_graph']['neighborhoods'],
+                not options.get('nonreducedgraph', False),
+                context=document.context, config=document.config)
+
+        document.addPackageResource(PackagePreCleanupCB(data=make_neighborhood_pages))
+
     def make_legend() -> None:
         """
         Extend the dependency graph legend defined by the depgraph plugin
@@ -321,3 +574,5 @@ def ProcessOptions(options, document):
                                                                              GITHUB_ISSUE_TPL])
     document.userdata['dep_graph'].setdefault('extra_modal_links_tpl', []).extend([
         LEAN_LINKS_TPL, GITHUB_LINK_TPL])
+    if 'neighborhood' in options:
+        document.userdata['thm_header_hidden_extras_tpl'].append(NEIGHBORHOOD_LINK_TPL)
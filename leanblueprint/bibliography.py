@@ -0,0 +1,151 @@
+"""
+Bibliography of the web version.
+
+plasTeX does not run BibTeX, it reads the bibliography of `web.tex` from
+`web.bbl` in the blueprint sources. Instead of compiling the pdf version to get
+this file, the sources are read starting from `web.tex` and following `\\input`
+and `\\include` to find the cited keys, the bibliography databases and the
+bibliography style, and BibTeX runs alone on an auxiliary file containing them.
+
+The resulting `.bbl` file is cached, keyed on the cited keys (in order of first
+citation, which some styles use), the content of the databases and the style,
+so that BibTeX only runs when one of them changes.
+
+Blueprints whose bibliography is only declared in the pdf version still get
+it from `print.bbl`, copied by the client after compiling the pdf version,
+see `uses_print_bibliography`.
+"""
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from leanblueprint.cache import DiskCache, digest, file_digest, write_if_changed
+from leanblueprint.sources import flat_source
+
+# Cache of bibliographies, in the blueprint folder.
+BIB_CACHE = '.bib_cache'
+BIB_CACHE_SIZE = 1 << 24
+
+COMMAND = re.compile(r'\\(?P<name>bibliographystyle|bibliography|'
+                     r'[A-Za-z]*cite[A-Za-z]*)\*?\s*(?:\[[^\]]*\]\s*){0,2}\{(?P<arg>[^}]*)\}')
+
+# Commands matched by COMMAND whose argument is not a list of keys.
+NOT_CITATIONS = ['citestyle']
+
+
+class Citations:
+    """Cited keys, bibliography databases and style of a document."""
+
+    def __init__(self) -> None:
+        self.keys: Dict[str, None] = dict()
+        self.databases: List[str] = []
+        self.style: Optional[str] = None
+
+    def read(self, path: Path, src: Path) -> None:
+        """Read the TeX file at path and the files it inputs, relative to src."""
+        for match in COMMAND.finditer(flat_source(path, src)):
+            name, arg = match.group('name', 'arg')
+            if name == 'bibliography':
+                self.databases.extend(item.strip() for item in arg.split(',') if item.strip())
+            elif name == 'bibliographystyle':
+                self.style = arg.strip()
+            elif name not in NOT_CITATIONS:
+                self.keys.update(dict.fromkeys(key.strip() for key in arg.split(',')
+                                               if key.strip()))
+
+
+def citations(src: Path, name: str) -> Citations:
+    """Return the citations of the TeX file name in src and the files it inputs."""
+    result = Citations()
+    result.read(src/name, src)
+    return result
+
+
+def uses_print_bibliography(src: Path) -> bool:
+    """
+    Tell whether the bibliography of the web version comes from the pdf
+    version, since only `print.tex` declares bibliography databases.
+    """
+    return (not citations(src, 'web.tex').databases
+            and bool(citations(src, 'print.tex').databases))
+
+
+def database_path(src: Path, name: str) -> Path:
+    return src/(name if name.endswith('.bib') else name + '.bib')
+
+
+def style_path(src: Path, name: str) -> Path:
+    return src/(name + '.bst')
+
+
+def cache_key(src: Path, citations: Citations) -> str:
+    """Return the cache key of the bibliography of citations, relative to src."""
+    def local_digest(path: Path) -> str:
+        return file_digest(path) if path.is_file() else ''
+
+    return digest({'keys': list(citations.keys),
+                   'databases': [[name, local_digest(database_path(src, name))]
+                                 for name in citations.databases],
+                   'style': [citations.style,
+                             local_digest(style_path(src, citations.style or 'plain'))]})
+
+
+def run_bibtex(src: Path, citations: Citations,
+               run: Callable[[str, Path], Any]) -> Optional[str]:
+    """
+    Run BibTeX on citations in a temporary folder, using run(command, cwd),
+    and return the content of the resulting bbl file, or None if it failed.
+    Databases and style found relative to src, possibly outside of it, are
+    copied to the temporary folder under new names. Other ones are left to
+    BibTeX to find in the TeX installation.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        databases = []
+        for i, name in enumerate(citations.databases):
+            path = database_path(src, name)
+            if path.is_file():
+                name = f'database{i}'
+                shutil.copy(path, tmp_dir/f'{name}.bib')
+            databases.append(name)
+        style = citations.style or 'plain'
+        if citations.style and style_path(src, style).is_file():
+            shutil.copy(style_path(src, style), tmp_dir/'style.bst')
+            style = 'style'
+        aux = ['\\relax', *[f'\\citation{{{key}}}' for key in citations.keys],
+               f'\\bibstyle{{{style}}}', f'\\bibdata{{{",".join(databases)}}}']
+        (tmp_dir/'web.aux').write_text('\n'.join(aux) + '\n', encoding='utf8')
+        result = run('bibtex web', tmp_dir)
+        bbl_path = tmp_dir/'web.bbl'
+        # BibTeX exits with 1 when it only issued warnings, for instance
+        # about a missing entry.
+        if result.returncode >= 2 or not bbl_path.exists():
+            return None
+        return bbl_path.read_text(encoding='utf8', errors='replace')
+
+
+def web_bibliography(blueprint_root: Path, run: Callable[[str, Path], Any]) -> Optional[bool]:
+    """
+    Write src/web.bbl for the blueprint in blueprint_root, running BibTeX
+    using run(command, cwd) unless the result is cached. Return None if the
+    blueprint has no bibliography, otherwise whether BibTeX ran.
+    Raise RuntimeError if BibTeX failed.
+    """
+    src = blueprint_root/'src'
+    web_citations = citations(src, 'web.tex')
+    if not web_citations.databases:
+        return None
+    cache = DiskCache(blueprint_root/BIB_CACHE, BIB_CACHE_SIZE)
+    key = cache_key(src, web_citations)
+    data = cache.get(key)
+    ran = data is None
+    if data is None:
+        bbl = run_bibtex(src, web_citations, run)
+        if bbl is None:
+            raise RuntimeError('BibTeX failed, see its output above.')
+        data = bbl.encode('utf8')
+        cache.put(key, data)
+    write_if_changed(src/'web.bbl', data.decode('utf8'))
+    return ran
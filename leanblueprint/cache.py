@@ -0,0 +1,186 @@
+"""
+Fingerprints of build inputs.
+
+Build steps record a digest of their inputs next to their outputs and are
+skipped when the recorded digest matches the current one.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def file_digest(path: Path) -> str:
+    """Return the SHA-256 hex digest of the content of the file at path."""
+    sha = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def tree_digests(root: Path, exclude: Iterable[str] = ()) -> Dict[str, str]:
+    """
+    Return a dictionary mapping the path relative to root of each file below
+    root to its digest. Files or folders whose name matches one of the
+    exclude patterns are skipped, as well as `__pycache__` folders.
+    """
+    exclude = ['__pycache__', *exclude]
+    digests = dict()
+    for path in sorted(root.rglob('*')):
+        rel_path = path.relative_to(root)
+        if any(fnmatch(part, pattern) for part in rel_path.parts for pattern in exclude):
+            continue
+        if path.is_file():
+            digests[rel_path.as_posix()] = file_digest(path)
+    return digests
+
+
+def package_versions(*names: str) -> Dict[str, str]:
+    """Return the installed version of each of the given Python distributions."""
+    # Imported here since this is slow and the client does not always need it.
+    from importlib.metadata import PackageNotFoundError, version
+    versions = dict()
+    for name in names:
+        try:
+            versions[name] = version(name)
+        except PackageNotFoundError:
+            versions[name] = ''
+    return versions
+
+
+def digest(data: Any) -> str:
+    """Return a digest of JSON serializable data."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def read_stamp(path: Path) -> Dict[str, Any]:
+    """
+    Read a stamp file written by write_stamp, returning an empty dictionary
+    if it does not exist or cannot be read.
+    """
+    try:
+        return json.loads(path.read_text(encoding='utf8'))
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_stamp(path: Path, data: Dict[str, Any]) -> None:
+    """Record data in a stamp file."""
+    path.write_text(json.dumps(data, indent=1, sort_keys=True), encoding='utf8')
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    """
+    Write text to the file at path, unless it already has this content, so
+    that its modification time only changes with its content. The file is
+    replaced atomically, readers never see a partially written file.
+    Return whether the file was written.
+    """
+    try:
+        if path.read_text(encoding='utf8') == text:
+            return False
+    except (OSError, ValueError):
+        pass
+    try:
+        mode = path.stat().st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            f.write(text)
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, str(path))
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return True
+
+
+# Fraction of the size bound of a DiskCache kept when evicting entries.
+EVICTED_SIZE = 0.9
+
+
+class DiskCache:
+    """
+    A cache of byte strings stored as files in a folder, bounded in total
+    size. When the bound is exceeded, least recently used entries are
+    removed. Keys must be usable as file names, typically digests.
+
+    The total size is read from the folder at the first write, then kept up
+    to date by each write, so the folder is only scanned again when entries
+    have to be removed. Eviction then goes down to `EVICTED_SIZE` of the
+    bound, so that a full cache is not scanned again at each write.
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self._size: Optional[int] = None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the data stored under key, or None if there is none."""
+        path = self.directory/key
+        try:
+            data = path.read_bytes()
+            # The modification time records the last use, see evict.
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store data under key, then evict entries if needed."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._size is None:
+            self._size = sum(entry[1] for entry in self.entries())
+        path = self.directory/key
+        try:
+            self._size -= path.stat().st_size
+        except OSError:
+            pass
+        fd, tmp_name = tempfile.mkstemp(dir=str(self.directory), prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, str(path))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        self._size += len(data)
+        if self._size > self.max_size:
+            self.evict()
+
+    def entries(self) -> List[Tuple[float, int, Path]]:
+        """Return the modification time, size and path of each entry."""
+        entries = []
+        for path in self.directory.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if not path.name.startswith('.'):
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the size bound is met, with
+        some room to spare if entries have to be removed.
+        """
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        target = self.max_size if size <= self.max_size else EVICTED_SIZE*self.max_size
+        for _, entry_size, path in sorted(entries, key=lambda entry: entry[0]):
+            if size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
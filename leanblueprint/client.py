@@ -1,29 +1,40 @@
-import http.server
+"""
+Command line client.
+
+The client starts fast since it is called often, for instance by editor
+integrations: the git repository and lakefile of the project are only looked
+up by commands which need them, and heavy modules (GitPython, Jinja2, tomlkit,
+the build scheduler and the web server) are imported when they are used.
+"""
 import logging
 import os
 import platform
 import re
 import shutil
-import socketserver
 import subprocess
 import sys
-import tomlkit
-from tomlkit.toml_file import TOMLFile
-from tomlkit import TOMLDocument
+import threading
+import time
 from collections import deque
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional, NoReturn
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, NoReturn, Tuple
 from textwrap import dedent
 from abc import ABC, abstractmethod
 
 import rich_click as click
-from git.exc import GitCommandError, InvalidGitRepositoryError
-from git.repo import Repo
-from jinja2 import Environment, FileSystemLoader
 from rich.console import Console
-from rich.prompt import Confirm, IntPrompt, Prompt
 from rich.theme import Theme
 
+from leanblueprint.cache import (digest, file_digest, package_versions,
+                                 read_stamp, tree_digests, write_stamp)
+from leanblueprint.decls import DeclIndex
+
+if TYPE_CHECKING:
+    from git.repo import Repo
+    from tomlkit import TOMLDocument
+
 log = logging.getLogger("Mathlib tools")
 log.setLevel(logging.INFO)
 if (log.hasHandlers()):
@@ -130,8 +141,9 @@ class LakefileLean(Lakefile):
 
 class LakefileToml(Lakefile):
     def __init__(self, lakefile_toml: Path):
+        from tomlkit.toml_file import TOMLFile
         self._file = TOMLFile(lakefile_toml)
-        self._toml: TOMLDocument = self._file.read()
+        self._toml: 'TOMLDocument' = self._file.read()
         super().__init__(lakefile_toml)
 
     def parse_libs(self) -> List[str]:
@@ -156,6 +168,7 @@ class LakefileToml(Lakefile):
 
     def _add_require(self, name:str, git:str, rev:Optional[str] = None) -> None:
         """Add a [[require]] to self._toml and dump it"""
+        import tomlkit
         require = tomlkit.aot()
         item = {'name':name,'git':git}
         if rev:
@@ -189,16 +202,19 @@ console = Console(theme=custom_theme)
 
 
 def ask(*args, **kwargs) -> str:
+    from rich.prompt import Prompt
     kwargs.update({'console': console})
     return Prompt.ask(*args, **kwargs)
 
 
 def confirm(*args, **kwargs) -> bool:
+    from rich.prompt import Confirm
     kwargs.update({'console': console})
     return Confirm.ask(*args, **kwargs)
 
 
 def askInt(*args, **kwargs) -> int:
+    from rich.prompt import IntPrompt
     kwargs.update({'console': console})
     return IntPrompt.ask(*args, **kwargs)
 
@@ -215,51 +231,132 @@ def error(msg: str) -> NoReturn:
 @click.group(cls=CustomMultiCommand, context_settings={'help_option_names': ['-h', '--help']})
 @click.option('--debug', 'python_debug', default=False, is_flag=True,
               help='Display python tracebacks in case of error.')
+@click.option('-b', '--blueprint', 'blueprints', multiple=True,
+              type=click.Path(exists=True, file_okay=False, path_type=Path),
+              help='Blueprint folder to build instead of the blueprint folder of the project. '
+              'Can be given several times.')
+@click.option('--all-blueprints', is_flag=True, default=False,
+              help='Build all blueprints of the project, that is all folders containing src/web.tex.')
+@click.option('--blueprint-jobs', type=int, default=None,
+              help='Number of blueprints built at the same time. Defaults to the number of processors.')
 @click.version_option()
-def cli(python_debug: bool) -> None:
+def cli(python_debug: bool, blueprints: Tuple[Path, ...], all_blueprints: bool,
+        blueprint_jobs: Optional[int]) -> None:
     """Command line client to manage Lean blueprints.
     Use leanblueprint COMMAND --help to get more help on any specific command."""
-    global debug
+    global debug, requested_blueprints, all_blueprints_requested, blueprint_jobs_count
     debug = python_debug
+    requested_blueprints = [path.resolve() for path in blueprints]
+    all_blueprints_requested = all_blueprints
+    blueprint_jobs_count = blueprint_jobs or os.cpu_count() or 1
 
 
-# locate repo
+# Project location, see project_root, get_repo and get_lakefile.
+_project_root: Optional[Path] = None
+_repo: Optional['Repo'] = None
+_lakefile: Optional[Lakefile] = None
 
-repo: Optional[Repo] = None
-try:
-    repo = Repo(".", search_parent_directories=True)
-except InvalidGitRepositoryError:
-    error("Could not find a Lean project. Please run this command from inside your project folder.")
 
-assert repo is not None
-
-# locate lakefile
+def project_root() -> Path:
+    """
+    Return the root folder of the Lean project, that is the closest folder
+    containing the current one and a git repository.
+    """
+    global _project_root
+    if _project_root is None:
+        cwd = Path.cwd().resolve()
+        _project_root = next((folder for folder in [cwd, *cwd.parents]
+                              if (folder/".git").exists()), None)
+        if _project_root is None:
+            error("Could not find a Lean project. Please run this command from inside your project folder.")
+    return _project_root
+
+
+def get_repo() -> 'Repo':
+    """Return the git repository of the Lean project."""
+    global _repo
+    if _repo is None:
+        from git.exc import InvalidGitRepositoryError
+        from git.repo import Repo
+        try:
+            _repo = Repo(project_root())
+        except InvalidGitRepositoryError:
+            error("Could not find a Lean project. Please run this command from inside your project folder.")
+    return _repo
+
+
+def get_lakefile() -> Lakefile:
+    """Return the lakefile of the Lean project."""
+    global _lakefile
+    if _lakefile is None:
+        lakefile_lean_path = project_root()/"lakefile.lean"
+        lakefile_toml_path = project_root()/"lakefile.toml"
+        if lakefile_lean_path.exists() and lakefile_toml_path.exists():
+            warning("Both lakefile.lean and lakefile.toml exist; using lakefile.lean")
+            _lakefile = LakefileLean(lakefile_lean_path)
+        elif lakefile_lean_path.exists():
+            _lakefile = LakefileLean(lakefile_lean_path)
+        elif lakefile_toml_path.exists():
+            _lakefile = LakefileToml(lakefile_toml_path)
+        else:
+            error(f"Could not find lakefile.lean or lakefile.toml in {project_root()}")
+    return _lakefile
 
-lakefile_lean_path = Path(repo.working_dir)/"lakefile.lean"
-lakefile_toml_path = Path(repo.working_dir)/"lakefile.toml"
 
-lakefile: Optional[Lakefile] = None
+# Blueprint folders given by the --blueprint and --all-blueprints options,
+# and the number of them built at the same time.
+requested_blueprints: List[Path] = []
+all_blueprints_requested = False
+blueprint_jobs_count = 1
 
-if lakefile_lean_path.exists() and lakefile_toml_path.exists():
-    warning("Both lakefile.lean and lakefile.toml exist; using lakefile.lean")
-    lakefile = LakefileLean(lakefile_lean_path)
-elif lakefile_lean_path.exists():
-    lakefile = LakefileLean(lakefile_lean_path)
-elif lakefile_toml_path.exists():
-    lakefile = LakefileToml(lakefile_toml_path)
-else:
-    error(f"Could not find lakefile.lean or lakefile.toml in {repo.working_dir}")
+# Blueprint folder of the current build, and all blueprint folders handled by
+# build commands, set by locate_blueprints.
+blueprint_root = Path("blueprint")
+blueprint_roots: List[Path] = []
 
-# blueprint root directory
 
-blueprint_root = Path(repo.working_dir)/"blueprint"
+def locate_blueprints() -> None:
+    """
+    Set the blueprint folders handled by the current command: those given on
+    the command line or, by default, the blueprint folder of the project.
+    """
+    global blueprint_root, blueprint_roots
+    roots = list(requested_blueprints)
+    if all_blueprints_requested:
+        roots.extend(find_blueprints())
+        if not roots:
+            error(f"Could not find any blueprint in {project_root()}.")
+    blueprint_roots = list(dict.fromkeys(roots)) or [project_root()/"blueprint"]
+    blueprint_root = blueprint_roots[0]
+
+# log of a blueprint build when several blueprints are built, inside its folder
+BUILD_LOG = "build.log"
+
+# file recording the inputs of the last build, inside the output folder
+BUILD_STAMP = ".build_stamp.json"
+
+# checkdecls results and report, inside the blueprint folder
+CHECKDECLS_CACHE = ".checkdecls_cache.json"
+CHECKDECLS_REPORT = "checkdecls.json"
+# path of the doc-gen declaration data read by the last html build, inside the
+# blueprint folder, written by the blueprint plasTeX package
+DOC_DATA_RECORD = ".doc_data_path"
+# line of checkdecls output reporting a missing declaration
+CHECKDECLS_MISSING = re.compile(r'^\s*(\S+) is missing\.?\s*$', re.MULTILINE)
+PROFILE_TRACE = "profile.json"
+PROFILE_EVENTS = ".profile_events.jsonl"
 
 @cli.command()
 def new() -> None:
     """
     Create a new Lean blueprint in the given repository.
     """
-    assert lakefile is not None
+    from git.exc import GitCommandError
+    from jinja2 import Environment, FileSystemLoader
+
+    repo = get_repo()
+    lakefile = get_lakefile()
+    locate_blueprints()
     loader = FileSystemLoader(Path(__file__).parent/"templates")
     env = Environment(loader=loader, variable_start_string='{|', variable_end_string='|}',
                       comment_start_string='{--', comment_end_string='--}')
@@ -267,9 +364,6 @@ def new() -> None:
     console.print("\nWelcome to Lean blueprint\n", style="title")
     can_try_ci = True
 
-    if repo is None:
-        error("Could not find a Lean project. Please run this command from inside your project folder.")
-
     if repo.is_dirty():
         error("The repository contains uncommitted changes. Please clean it up before creating a blueprint.")
 
@@ -463,57 +557,465 @@ def new() -> None:
     else:
         console.print("\nYou are all set :tada:\n")
 
-def mk_pdf() -> None:
-    (blueprint_root/"print").mkdir(exist_ok=True)
-    subprocess.run("latexmk -output-directory=../print", cwd=str(
-        blueprint_root/"src"), check=True, shell=True)
-    bbl_path = blueprint_root/"print"/"print.bbl"
-    if bbl_path.exists():
+def find_blueprints() -> List[Path]:
+    """
+    Return the blueprint folders of the project, that is the folders (at most
+    two levels below the project root) containing src/web.tex.
+    """
+    root = project_root()
+    return sorted(path.parent.parent for pattern in ['*/src/web.tex', '*/*/src/web.tex']
+                  for path in root.glob(pattern)
+                  if not any(part.startswith('.') for part in path.relative_to(root).parts))
+
+
+def build_blueprint(root: Path, actions: List[Callable[[], Any]]) -> Tuple[Optional[str], float]:
+    """
+    Run the given actions on the blueprint in root, in a worker process, with
+    all output going to root/build.log. Return an error message, or None if
+    the actions succeeded, and the time they took.
+    """
+    global blueprint_root
+    blueprint_root = root
+    start = time.perf_counter()
+    with (root/BUILD_LOG).open('w', encoding='utf8') as log_file:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+        try:
+            for action in actions:
+                action()
+            message = None
+        except SystemExit as err:
+            message = f"exited with code {err.code}"
+        except Exception as err:
+            message = str(err) or type(err).__name__
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+    return message, time.perf_counter() - start
+
+
+def for_each_blueprint(actions: List[Callable[[], Any]]) -> None:
+    """
+    Run the given actions on each blueprint root. When there are several
+    roots, they are handled in a pool of processes, each one writing its
+    output to its own build.log, and a summary is printed at the end.
+    """
+    if len(blueprint_roots) == 1:
+        for action in actions:
+            action()
+        return
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from rich.table import Table
+
+    results: Dict[Path, Tuple[Optional[str], float]] = dict()
+    # Worker processes are spawned rather than forked since this may run
+    # in a thread of the task scheduler.
+    with ProcessPoolExecutor(max_workers=max(1, min(blueprint_jobs_count, len(blueprint_roots))),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(build_blueprint, root, actions): root for root in blueprint_roots}
+        for future in as_completed(futures):
+            root = futures[future]
+            try:
+                results[root] = future.result()
+            except Exception as err:
+                results[root] = (str(err) or type(err).__name__, 0.0)
+            console.print(f"{root}: {'failed' if results[root][0] else 'done'}", style="info")
+    table = Table('Blueprint', 'Status', 'Time', 'Log')
+    for root in blueprint_roots:
+        message, duration = results[root]
+        table.add_row(str(root), f"[error]failed[/]: {message}" if message else 'done',
+                      f'{duration:.1f}s', str(root/BUILD_LOG))
+    console.print(table)
+    failed = [root for root in blueprint_roots if results[root][0]]
+    if failed:
+        error(f"{len(failed)} of {len(blueprint_roots)} blueprints failed, see their {BUILD_LOG}.")
+
+
+@contextmanager
+def profiled(enabled: bool) -> Iterator[None]:
+    """
+    Profile the build steps run inside this context if enabled, then print
+    a summary and write a trace to blueprint/profile.json.
+    """
+    if not enabled:
+        yield
+        return
+    from leanblueprint import profiling
+    profiling.start(blueprint_root/PROFILE_EVENTS)
+    try:
+        yield
+    finally:
+        profiling.finish(blueprint_root/PROFILE_TRACE, console)
+
+
+profile_option = click.option(
+    '--profile', is_flag=True, default=False,
+    help='Record the time and memory use of each build stage, see blueprint/profile.json.')
+
+
+def mk_pdf(force: bool = False) -> bool:
+    """
+    Compile the pdf version unless it is up to date. Return whether latexmk ran.
+    """
+    print_dir = blueprint_root/"print"
+    print_dir.mkdir(exist_ok=True)
+    stamp_path = print_dir/BUILD_STAMP
+    key = digest(tree_digests(blueprint_root/"src", exclude=['*.paux', 'web.bbl']))
+    if not force and read_stamp(stamp_path).get('key') == key and (print_dir/"print.pdf").exists():
+        console.print("The pdf version is up to date, skipping latexmk.")
+        return False
+    if stamp_path.exists():
+        stamp_path.unlink()
+    from leanblueprint.bibliography import uses_print_bibliography
+    from leanblueprint.tasks import run_command
+    run_command("latexmk -output-directory=../print", blueprint_root/"src")
+    bbl_path = print_dir/"print.bbl"
+    if bbl_path.exists() and uses_print_bibliography(blueprint_root/"src"):
         shutil.copy(bbl_path, blueprint_root/"src"/"web.bbl")
-    
+    write_stamp(stamp_path, {'key': key})
+    return True
+
+
 @cli.command()
-def pdf() -> None:
+@click.option('--force', is_flag=True, default=False,
+              help='Run latexmk even if the sources did not change since the last build.')
+@profile_option
+def pdf(force: bool, profile: bool) -> None:
     """
     Compile the pdf version of the blueprint using latexmk.
     """
-    mk_pdf()
+    locate_blueprints()
+    with profiled(profile):
+        for_each_blueprint([partial(mk_pdf, force)])
+
+
+def doc_data_state() -> Optional[List[Any]]:
+    """
+    Describe the doc-gen declaration data read by the last html build, if it
+    used the localdocs option: its path, modification time and size. Like the
+    cache of the documentation index, this does not read the data itself,
+    which is large for projects depending on Mathlib.
+    """
+    try:
+        path = Path((blueprint_root/DOC_DATA_RECORD).read_text(encoding='utf8'))
+    except OSError:
+        return None
+    try:
+        stat = path.stat()
+    except OSError:
+        return [str(path)]
+    return [str(path), stat.st_mtime_ns, stat.st_size]
+
+
+def web_inputs() -> Dict[str, Any]:
+    """
+    Describe everything the html version of the blueprint depends on: the
+    blueprint sources (including plastex.cfg, macros and web.bbl, written by
+    mk_bib), the local Lean documentation data and the installed plasTeX and
+    plugins versions.
+    """
+    return {
+        'sources': tree_digests(blueprint_root/"src", exclude=['*.paux']),
+        'docs': doc_data_state(),
+        'packages': package_versions('plasTeX', 'plastexdepgraph', 'plastexshowmore',
+                                     'leanblueprint'),
+        'leanblueprint': tree_digests(Path(__file__).parent, exclude=['jekyll_templates'])
+    }
+
+
+def mk_bib() -> None:
+    """
+    Write the bibliography of the html version, running BibTeX unless the
+    cited keys and bibliography files did not change.
+    """
+    from leanblueprint.bibliography import web_bibliography
+    from leanblueprint.tasks import run_command
+    try:
+        if web_bibliography(blueprint_root, partial(run_command, check=False)):
+            console.print("Updated the bibliography of the html version.", style="info")
+    except RuntimeError as err:
+        warning(f"{err} The html version uses the previous bibliography, if any.")
+
+
+def run_plastex() -> None:
+    """
+    Run plasTeX on the blueprint sources, through the build daemon of the
+    project if it is running.
+    """
+    from leanblueprint import daemon
+    from leanblueprint.tasks import run_command
+
+    cmd = "plastex -c plastex.cfg web.tex"
+    try:
+        path = (daemon.socket_path(project_root(), create=False)
+                if daemon.available() else None)
+    except OSError:
+        # No daemon can be listening in a missing or unsafe socket folder.
+        path = None
+    if path is None or not daemon.is_running(path):
+        run_command(cmd, blueprint_root/"src")
+        return
+    from leanblueprint import profiling
+    console.print("Building using the build daemon.", style="info")
+    with profiling.stage(cmd, 'subprocess'):
+        returncode = daemon.build(path, blueprint_root/"src", cmd.split()[1:],
+                                  partial(print, end='', flush=True))
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def update_statuses() -> bool:
+    """
+    Update the statuses of nodes in the html version without running plasTeX.
+    Return whether this was possible.
+    """
+    from leanblueprint.status_update import update_web
+    try:
+        count = update_web(blueprint_root/"src", blueprint_root/"web")
+    except (OSError, ValueError) as err:
+        console.print(f"Statuses cannot be updated without plasTeX: {err}.", style="info")
+        return False
+    console.print(f"Only status markers changed, updated {count} node statuses "
+                  "without plasTeX.", style="info")
+    return True
+
+
+def mk_web(force: bool = False) -> bool:
+    """
+    Compile the html version unless it is up to date. When only status markers
+    changed since the last build, statuses are updated without plasTeX.
+    Return whether plasTeX ran.
+    """
+    from leanblueprint.status_update import skeleton_digests
+
+    web_dir = blueprint_root/"web"
+    web_dir.mkdir(exist_ok=True)
+    stamp_path = web_dir/BUILD_STAMP
+    stamp = read_stamp(stamp_path)
+    mk_bib()
+    inputs = web_inputs()
+    key = digest(inputs)
+    if not force and stamp.get('key') == key and (blueprint_root/"lean_decls").exists():
+        console.print("The html version is up to date, skipping plasTeX.")
+        return False
+
+    def make_stamp(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        skeleton = skeleton_digests(blueprint_root/"src", inputs['sources'])
+        return {'key': digest(inputs), 'skeleton_key': digest({**inputs, 'sources': skeleton}),
+                'sources': inputs['sources']}
+
+    new_stamp = make_stamp(inputs)
+    if stamp:
+        old_sources = stamp.get('sources', {})
+        changed = sorted(name for name in set(old_sources).union(inputs['sources'])
+                         if old_sources.get(name) != inputs['sources'].get(name))
+        if changed:
+            console.print(f"Changed sources: {', '.join(changed)}", style="info")
+        if not force and stamp.get('skeleton_key') == new_stamp['skeleton_key'] and update_statuses():
+            write_stamp(stamp_path, new_stamp)
+            return False
+        stamp_path.unlink()
+    run_plastex()
+    docs = doc_data_state()
+    if docs != inputs['docs']:
+        # The build recorded documentation data it read for the first time.
+        new_stamp = make_stamp({**inputs, 'docs': docs})
+    write_stamp(stamp_path, new_stamp)
+    return True
 
 
-def mk_web() -> None:
-    (blueprint_root/"web").mkdir(exist_ok=True)
-    subprocess.run("plastex -c plastex.cfg web.tex",
-                   cwd=str(blueprint_root/"src"), check=True, shell=True)
 @cli.command()
-def web() -> None:
+@click.option('--force', is_flag=True, default=False,
+              help='Run plasTeX even if the sources did not change since the last build.')
+@profile_option
+def web(force: bool, profile: bool) -> None:
     """
     Compile the html version of the blueprint using plasTeX.
     """
-    mk_web()
+    locate_blueprints()
+    with profiled(profile):
+        for_each_blueprint([partial(mk_web, force)])
+
+@cli.command('daemon')
+@click.option('--stop', is_flag=True, default=False,
+              help='Stop the build daemon of the project instead of starting it.')
+def daemon_command(stop: bool) -> None:
+    """
+    Start a build daemon keeping plasTeX loaded, to speed up builds of the html version.
+
+    While the daemon runs, the web, watch and all commands send their
+    plasTeX builds to it instead of starting a new plasTeX process each
+    time. Stop it with Ctrl-c or leanblueprint daemon --stop.
+    """
+    from leanblueprint import daemon
+
+    if not daemon.available():
+        error("The build daemon is not available on this platform.")
+    try:
+        path = daemon.socket_path(project_root())
+    except OSError as err:
+        error(f"Could not use the build daemon socket folder: {err}")
+    if stop:
+        if not daemon.is_running(path):
+            error("No build daemon is running for this project.")
+        for _ in daemon.request(path, {'stop': True}):
+            pass
+        console.print("Build daemon stopped.")
+        return
+    try:
+        daemon.serve(path, console.print)
+    except RuntimeError as err:
+        error(str(err))
+    except KeyboardInterrupt:
+        pass
+
+
+def lean_project_state() -> Dict[str, Any]:
+    """
+    Describe the state of the Lean project: its toolchain, the revisions of its
+    dependencies and its Lean files. Tracked files which are not modified are
+    described by git's index, so that they do not need to be read.
+    """
+    repo = get_repo()
+    root = Path(repo.working_dir)
+    changed = repo.git.ls_files('--modified', '--others', '--exclude-standard',
+                                '--', '*.lean').splitlines()
+    return {
+        'toolchain': {name: file_digest(root/name)
+                      for name in ['lean-toolchain', 'lake-manifest.json']
+                      if (root/name).exists()},
+        'index': repo.git.ls_files('--stage', '--', '*.lean'),
+        'changed': {name: file_digest(root/name) for name in changed if (root/name).exists()}
+    }
+
+
+def check_shard(names: List[str], names_path: Path) -> Dict[str, bool]:
+    """
+    Run checkdecls on the given declaration names, which are first written
+    to names_path, and tell which ones exist. Lake runs in the root of the
+    Lean project, which is not the parent of nested blueprints.
+    """
+    from leanblueprint.tasks import run_command
+    root = project_root()
+    names_path.write_text("\n".join(names))
+    try:
+        result = run_command(f"lake exe checkdecls {names_path.relative_to(root).as_posix()}",
+                             root, capture=True, check=False)
+    finally:
+        names_path.unlink()
+    if result.returncode == 0:
+        return dict.fromkeys(names, True)
+    # Only trust the lines reporting missing declarations, and fail so that
+    # nothing is cached when checkdecls failed for another reason.
+    reported = set(CHECKDECLS_MISSING.findall(result.stdout))
+    missing = {name for name in names if name in reported}
+    if not missing:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout)
+    return {name: name not in missing for name in names}
+
+
+def check_declarations(names: List[str], jobs: int = 1) -> Dict[str, bool]:
+    """
+    Run checkdecls on the given declaration names and tell which ones exist.
+    The names are split into at most jobs shards of balanced sizes, which are
+    checked by concurrent checkdecls processes.
+    """
+    count = max(1, min(jobs, len(names)))
+    if count == 1:
+        return check_shard(names, blueprint_root/"lean_decls_unchecked")
+    from leanblueprint.tasks import Task, run_tasks
+    results: Dict[str, bool] = dict()
+
+    def check(shard: List[str], names_path: Path) -> None:
+        results.update(check_shard(shard, names_path))
+
+    tasks = []
+    for i in range(count):
+        shard = names[i*len(names)//count:(i + 1)*len(names)//count]
+        names_path = blueprint_root/f"lean_decls_unchecked.{i}"
+        tasks.append(Task(f'checkdecls {i + 1}/{count}', partial(check, shard, names_path)))
+    run_tasks(tasks, count)
+    return {name: results[name] for name in names}
+
+
+def do_checkdecls(jobs: int = 1) -> None:
+    decls_path = blueprint_root/"lean_decls"
+    if not decls_path.exists():
+        error("Could not find blueprint/lean_decls. Please build the html version of the blueprint first.")
+    names = list(dict.fromkeys(name.strip() for name in decls_path.read_text().splitlines()
+                               if name.strip()))
+    cache_path = blueprint_root/CHECKDECLS_CACHE
+    cache = read_stamp(cache_path)
+    key = digest(lean_project_state())
+    results: Dict[str, bool] = cache.get('results', {}) if cache.get('key') == key else {}
+    unchecked = [name for name in names if name not in results]
+    if unchecked:
+        results.update(check_declarations(unchecked, jobs))
+    else:
+        console.print("The Lean project did not change since all those declarations were checked.")
+    results = {name: results[name] for name in names}
+    write_stamp(cache_path, {'key': key, 'results': results})
+    missing = [name for name in names if not results[name]]
+    index_path = blueprint_root/"lean_decls.json"
+    index = DeclIndex.load(index_path) if index_path.exists() else DeclIndex({})
+    write_stamp(blueprint_root/CHECKDECLS_REPORT,
+                {'declarations': len(names), 'checked': len(unchecked), 'missing': missing,
+                 'missing_in_nodes': {name: index.nodes(name) for name in missing}})
+    if missing:
+        error(f"Missing declarations: {', '.join(missing)}")
 
-def do_checkdecls() -> None:
-    subprocess.run("lake exe checkdecls blueprint/lean_decls",
-                   cwd=str(blueprint_root.parent), check=True, shell=True)
 
 @cli.command()
-def checkdecls() -> None:
+@click.option('-j', '--jobs', default=1, show_default=True,
+              help='Number of checkdecls processes running at the same time.')
+def checkdecls(jobs: int) -> None:
     """
     Check that each declaration mentioned in the blueprint exists in Lean.
     Requires to build the project and the blueprint first.
+
+    Results are cached, so only new declarations are checked as long as the
+    Lean project does not change. The list of missing declarations is written
+    to blueprint/checkdecls.json.
     """
-    do_checkdecls()
+    locate_blueprints()
+    for_each_blueprint([partial(do_checkdecls, jobs)])
 
 
 @cli.command()
-def all() -> None:
+@click.option('-j', '--jobs', default=4, show_default=True,
+              help='Maximal number of steps running at the same time.')
+@profile_option
+def all(jobs: int, profile: bool) -> None:
     """
     Compile both the pdf and html versions of the blueprint and check declarations.
-    """
-    mk_pdf()
-    mk_web()
-    subprocess.run("lake build",
-                   cwd=str(blueprint_root.parent), check=True, shell=True)
-    do_checkdecls()
 
+    Independent steps run at the same time, and the pdf and html versions
+    are not compiled again if their sources did not change.
+    """
+    from leanblueprint.bibliography import uses_print_bibliography
+    from leanblueprint.tasks import Task, print_report, run_command, run_tasks
+
+    locate_blueprints()
+    if len(blueprint_roots) == 1:
+        # The web version waits for print.bbl when it has no bibliography of its own.
+        tasks = [Task('pdf', mk_pdf),
+                 Task('web', mk_web,
+                      deps=['pdf'] if uses_print_bibliography(blueprint_root/"src") else []),
+                 Task('lake build', lambda: run_command("lake build", project_root())),
+                 Task('checkdecls', do_checkdecls, deps=['web', 'lake build'])]
+    else:
+        tasks = [Task('pdf and web', lambda: for_each_blueprint([mk_pdf, mk_web])),
+                 Task('lake build', lambda: run_command("lake build", project_root())),
+                 Task('checkdecls', lambda: for_each_blueprint([do_checkdecls]),
+                      deps=['pdf and web', 'lake build'])]
+    with profiled(profile):
+        try:
+            run_tasks(tasks, jobs)
+        finally:
+            print_report(tasks, console)
 
 
 @cli.command()
@@ -523,28 +1025,64 @@ def serve() -> None:
 
     This is useful is order to see the dependency graph in particular.
     """
-    cwd = os.getcwd()
-    os.chdir(blueprint_root/'web')
-    Handler = http.server.SimpleHTTPRequestHandler
-    httpd = None
-    for port in range(8000, 8010):
-        try:
-            httpd = socketserver.TCPServer(("", port), Handler)
-            break
-        except OSError:
-            pass
+    from leanblueprint.server import make_server
+
+    locate_blueprints()
+    httpd = make_server(blueprint_root/'web')
     if httpd is None:
         print("Could not find an available port.")
         sys.exit(1)
     try:
-        (ip, port) = httpd.server_address
+        (ip, port) = httpd.server_address[:2]
         ip = ip or 'localhost'
         print(f'Serving http://{ip}:{port}/ \nPress Ctrl-c to interrupt.')
         httpd.serve_forever()
     except KeyboardInterrupt:
         pass
     httpd.server_close()
-    os.chdir(cwd)
+
+
+@cli.command()
+def watch() -> None:
+    """
+    Serve the html version of the blueprint and rebuild it each time its
+    sources change. Open pages are reloaded after each rebuild.
+
+    Installing the watchdog python package makes change detection faster.
+    """
+    from leanblueprint.server import LiveReload, make_server
+    from leanblueprint.watch import make_watcher
+
+    locate_blueprints()
+
+    def rebuild() -> None:
+        try:
+            mk_web()
+        except subprocess.CalledProcessError:
+            warning("The html build failed, waiting for the next change.")
+
+    rebuild()
+    live_reload = LiveReload()
+    httpd = make_server(blueprint_root/'web', live_reload)
+    if httpd is None:
+        print("Could not find an available port.")
+        sys.exit(1)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    watcher = make_watcher(blueprint_root/'src')
+    (ip, port) = httpd.server_address[:2]
+    ip = ip or 'localhost'
+    print(f'Serving http://{ip}:{port}/ and watching {blueprint_root/"src"}'
+          '\nPress Ctrl-c to interrupt.')
+    try:
+        while True:
+            watcher.wait()
+            rebuild()
+            live_reload.notify()
+    except KeyboardInterrupt:
+        pass
+    watcher.stop()
+    httpd.shutdown()
+    httpd.server_close()
 
 
 def safe_cli():
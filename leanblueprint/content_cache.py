@@ -0,0 +1,54 @@
+"""
+Rendered content of statements, shared by all pages showing them.
+
+The content of each statement of the dependency graphs is rendered in its own
+page, then again in the modal of each graph page showing it: the graph page of
+its chapter, the neighborhood pages and the JSON node fragments. Those renders
+are the bulk of the cost of graph pages, while the result is always the same
+since plasTeX urls do not depend on the page where they appear.
+
+`share_contents` makes the classes of the given nodes remember the content of
+each of them the first time it is rendered, for the rest of the build. This is
+kept in memory rather than on disk: the content depends on macros, numbering
+and references defined anywhere in the document, so it cannot be reused
+between builds based on the source of the statement alone, and the small
+templates added by the blueprint package to statements and modals are cheaper
+to render than to look up in a cache.
+
+The contents are stored in the userdata of the document, and each call to
+`share_contents` starts with an empty store, so nothing leaks from one build to
+the next when several builds run in the same process, for instance with the
+`watch` command. Nodes of documents which did not call `share_contents` are
+rendered as usual.
+"""
+from typing import Iterable
+
+# Attribute marking classes whose instances share their rendered content.
+SHARED = '_leanblueprint_shared_content'
+
+# Key of the rendered contents in the userdata of the document.
+CONTENTS = 'shared_contents'
+
+
+def share_contents(document, nodes: Iterable) -> None:
+    """Render the content of each of the given nodes of document at most once."""
+    document.userdata[CONTENTS] = dict()
+    for cls in {type(node) for node in nodes}:
+        if SHARED in vars(cls):
+            continue
+        # Rendering methods are only mixed into node classes by the renderer,
+        # so the inherited method is looked up when rendering.
+        own_render = vars(cls).get('__str__')
+
+        def rendered_content(node, cls=cls, own_render=own_render) -> str:
+            document = getattr(node, 'ownerDocument', None)
+            contents = getattr(document, 'userdata', {}).get(CONTENTS)
+            if contents is not None and node in contents:
+                return contents[node]
+            content = own_render(node) if own_render is not None else super(cls, node).__str__()
+            if contents is not None:
+                contents[node] = content
+            return content
+
+        cls.__str__ = rendered_content
+        setattr(cls, SHARED, True)
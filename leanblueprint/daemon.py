@@ -0,0 +1,274 @@
+"""
+Build daemon keeping plasTeX loaded between builds of the html version.
+
+Each `plastex` run pays for starting Python and importing plasTeX, its
+renderer, the depgraph and blueprint packages and the Graphviz bindings.
+`leanblueprint daemon` starts a process which imports all of them once and
+listens on a Unix socket. When it is running, the `web` and `watch`
+commands send their builds to it instead of running `plastex`.
+
+For each build, the daemon forks a child process which runs plasTeX and
+exits, so that no document state survives between builds while imported
+modules stay loaded. The output of the child is sent back to the client.
+
+Messages are JSON objects, one per line. A client sends a single request:
+{"build": {"cwd": ..., "args": [...], "env": {...}}} to run plasTeX with the
+given command line arguments, {"ping": true} or {"stop": true}. For a build,
+the daemon answers with {"output": text} messages followed by
+{"returncode": code}. Other requests get a single {"ok": true} answer.
+
+The socket lives in a folder only readable by the current user, and both
+sides check that the other one runs as the same user. Builds only receive the
+environment variables plasTeX and TeX need, see `FORWARDED_VARIABLES`.
+
+The daemon relies on fork, so it is not available on Windows.
+"""
+import atexit
+import hashlib
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import traceback
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Modules imported by the daemon before serving builds.
+PRELOADED_MODULES = ['plasTeX', 'plasTeX.TeX', 'plasTeX.client', 'plasTeX.Compile',
+                     'plasTeX.Base.LaTeX', 'plasTeX.Renderers.HTML5', 'pygraphviz',
+                     'plastexdepgraph.Packages.depgraph', 'plastexshowmore.Packages.showmore',
+                     'leanblueprint.Packages.blueprint']
+
+
+# Environment variables sent with builds, and prefixes of such variables.
+FORWARDED_VARIABLES = ['PATH', 'HOME', 'LANG', 'LANGUAGE', 'TZ', 'PYTHONPATH',
+                       'TEXINPUTS', 'BIBINPUTS', 'BSTINPUTS', 'KPATHSEA_DEBUG',
+                       'LEANBLUEPRINT_PROFILE']
+FORWARDED_PREFIXES = ['LC_', 'TEXMF']
+
+
+def available() -> bool:
+    """Tell whether the daemon can run on this platform."""
+    return hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX')
+
+
+def socket_dir(create: bool = True) -> Path:
+    """
+    Return the folder holding the sockets of the daemons of the current user,
+    in the runtime folder of the user if there is one, creating it if needed
+    and create is True. Raise OSError if it does not exist or can be used by
+    other users.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        path = Path(runtime_dir)/'leanblueprint'
+    else:
+        path = Path.home()/'.cache'/'leanblueprint'
+    if create:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    check_private(path)
+    return path
+
+
+def check_private(path: Path) -> None:
+    """Raise OSError unless path is owned by the current user and only usable by them."""
+    info = path.lstat()
+    if info.st_uid != os.getuid() or (stat.S_ISDIR(info.st_mode) and info.st_mode & 0o077):
+        raise OSError(f'{path} is not private to the current user.')
+
+
+def socket_path(project_root: Path, create: bool = True) -> Path:
+    """
+    Return the path of the socket of the daemon serving the project in
+    project_root. Its name is a digest of the project path since Unix socket
+    paths are limited to about a hundred characters. The folder of the socket
+    is created if create is True, see `socket_dir`.
+    """
+    key = hashlib.sha256(str(project_root.resolve()).encode()).hexdigest()[:16]
+    return socket_dir(create)/f'{key}.sock'
+
+
+def check_peer(conn: socket.socket) -> None:
+    """Raise OSError unless the process at the other end of conn runs as the current user."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # The ownership of the socket and its folder is checked instead.
+        return
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    if uid != os.getuid():
+        raise OSError('The other end of the daemon socket belongs to another user.')
+
+
+def forwarded(name: str) -> bool:
+    """Tell whether the environment variable name is sent with builds."""
+    return name in FORWARDED_VARIABLES or any(name.startswith(prefix)
+                                              for prefix in FORWARDED_PREFIXES)
+
+
+def build_environment() -> Dict[str, str]:
+    """Return the environment variables of the current process sent with builds."""
+    return {name: value for name, value in os.environ.items() if forwarded(name)}
+
+
+def send(conn: socket.socket, message: Dict[str, Any]) -> None:
+    conn.sendall((json.dumps(message) + '\n').encode())
+
+
+def messages(conn: socket.socket) -> Any:
+    """Iterate over the messages received on conn."""
+    with conn.makefile('r', encoding='utf8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def request(path: Path, message: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+    """
+    Send message to the daemon listening at path and iterate over its answers.
+    Raise OSError if no daemon of the current user is listening.
+    """
+    check_private(path.parent)
+    check_private(path)
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(timeout)
+        conn.connect(str(path))
+        check_peer(conn)
+        conn.settimeout(None)
+        send(conn, message)
+        yield from messages(conn)
+    finally:
+        conn.close()
+
+
+def is_running(path: Path) -> bool:
+    """Tell whether a daemon is listening at path."""
+    if not available() or not path.exists():
+        return False
+    try:
+        return any(answer.get('ok') for answer in request(path, {'ping': True}, timeout=1))
+    except (OSError, ValueError):
+        return False
+
+
+def build(path: Path, cwd: Path, args: List[str], output: Callable[[str], None]) -> int:
+    """
+    Run plasTeX with the command line arguments args in the folder cwd using
+    the daemon listening at path, with the variables of the environment of the
+    current process given by `build_environment`. Each piece of output is given to the output function. Return the exit
+    code of plasTeX.
+    """
+    returncode = 1
+    for answer in request(path, {'build': {'cwd': str(cwd), 'args': args,
+                                           'env': build_environment()}}):
+        if 'output' in answer:
+            output(answer['output'])
+        elif 'returncode' in answer:
+            returncode = answer['returncode']
+    return returncode
+
+
+def preload() -> None:
+    """Import the modules used by builds, and the configuration of renderers."""
+    import importlib
+    for name in PRELOADED_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    from plasTeX.client import collect_renderer_config
+    from plasTeX.Config import defaultConfig
+    collect_renderer_config(defaultConfig())
+
+
+def run_plastex(cwd: str, args: List[str], env: Dict[str, str]) -> int:
+    """
+    Run plasTeX as the plastex command would, with the forwarded variables of
+    the environment of the client env. This is called in a forked child.
+    """
+    from plasTeX.client import main
+    os.chdir(cwd)
+    for name in [name for name in os.environ if forwarded(name)]:
+        del os.environ[name]
+    os.environ.update(env)
+    sys.argv = ['plastex', *args]
+    try:
+        main(args)
+        return 0
+    except SystemExit as err:
+        return err.code if isinstance(err.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+
+
+def serve_build(conn: socket.socket, build_request: Dict[str, Any]) -> None:
+    """Run a build in a child process, sending its output and exit code on conn."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        conn.close()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(write_fd, 1)
+        os.dup2(write_fd, 2)
+        os.close(write_fd)
+        code = run_plastex(build_request['cwd'], build_request['args'], build_request['env'])
+        # Exit handlers record profiling data, among other things.
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+    os.close(write_fd)
+    # If the client goes away, the output is still read so that the build completes.
+    connected = True
+    with os.fdopen(read_fd, 'r', encoding='utf8', errors='replace') as pipe:
+        for line in pipe:
+            if connected:
+                try:
+                    send(conn, {'output': line})
+                except OSError:
+                    connected = False
+    _, status = os.waitpid(pid, 0)
+    if connected:
+        try:
+            send(conn, {'returncode': os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1})
+        except OSError:
+            pass
+
+
+def serve(path: Path, log: Callable[[str], None] = print) -> None:
+    """Serve builds on the socket at path until a stop request arrives."""
+    if is_running(path):
+        raise RuntimeError(f'A build daemon is already listening at {path}.')
+    if path.exists():
+        path.unlink()
+    preload()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(str(path))
+        path.chmod(0o600)
+        server.listen()
+        log(f'Build daemon listening at {path}.')
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    check_peer(conn)
+                    message = next(messages(conn), {})
+                except (OSError, ValueError):
+                    continue
+                if 'build' in message:
+                    log(f"Building in {message['build']['cwd']}.")
+                    serve_build(conn, message['build'])
+                else:
+                    send(conn, {'ok': True})
+                if message.get('stop'):
+                    log('Stopping the build daemon.')
+                    break
+    finally:
+        server.close()
+        if path.exists():
+            path.unlink()
@@ -0,0 +1,47 @@
+"""
+Index of the Lean declarations mentioned in a blueprint.
+
+The blueprint package writes, next to the plain `lean_decls` list used by
+checkdecls, a `lean_decls.json` file mapping each declaration name to the
+sorted labels of the blueprint nodes mentioning it. Tools can load it using
+`DeclIndex.load`.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class DeclIndex:
+    """Map from Lean declaration names to the labels of nodes mentioning them."""
+
+    def __init__(self, nodes: Dict[str, List[str]]):
+        self._nodes = nodes
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[str, str]]) -> 'DeclIndex':
+        """Build the index from (declaration, label) pairs, possibly repeated."""
+        nodes: Dict[str, set] = dict()
+        for decl, label in pairs:
+            nodes.setdefault(decl, set()).add(label)
+        return cls({decl: sorted(nodes[decl]) for decl in sorted(nodes)})
+
+    @classmethod
+    def load(cls, path: Path) -> 'DeclIndex':
+        return cls(json.loads(path.read_text(encoding='utf8')))
+
+    def dumps(self) -> str:
+        """Serialize the index as compact JSON, with sorted keys."""
+        return json.dumps(self._nodes, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    def nodes(self, decl: str) -> List[str]:
+        """Return the labels of the nodes mentioning decl."""
+        return self._nodes.get(decl, [])
+
+    def __contains__(self, decl: str) -> bool:
+        return decl in self._nodes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -0,0 +1,92 @@
+"""
+Links to the documentation of Lean declarations.
+
+By default, declarations are linked through the `find` page of doc-gen4,
+which downloads the data of all declarations and searches it in the browser
+before redirecting to the actual documentation page. When the documentation
+has been built locally, we can instead read the declaration data once and
+link directly to the module page of each declaration.
+
+Reading the declaration data of large projects (or projects depending on
+Mathlib) takes a while, so the resulting index is cached, and only rebuilt
+when the declaration data file changes.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from plasTeX.Logging import getLogger
+
+from leanblueprint.cache import write_if_changed
+
+log = getLogger()
+
+# Location of the declaration data in the output of doc-gen4. Despite its
+# extension, this is a JSON file.
+DECLARATION_DATA = 'declarations/declaration-data.bmp'
+
+
+class DocIndex:
+    """
+    Map from declaration names to documentation pages, relative to the
+    documentation root.
+    """
+
+    def __init__(self, pages: List[str], decls: Dict[str, int]):
+        self.pages = pages
+        self.decls = decls
+
+    @classmethod
+    def from_declaration_data(cls, path: Path) -> 'DocIndex':
+        """Index the declaration data written by doc-gen4 at path."""
+        data = json.loads(path.read_text(encoding='utf8'))
+        pages: Dict[str, int] = dict()
+        decls: Dict[str, int] = dict()
+        for name, info in data.get('declarations', {}).items():
+            page, _, anchor = info.get('docLink', '').partition('#')
+            # Declarations whose anchor is not their name are left
+            # to the find page.
+            if not page or anchor != name:
+                continue
+            if page.startswith('./'):
+                page = page[2:]
+            decls[name] = pages.setdefault(page, len(pages))
+        return cls(list(pages), decls)
+
+    def url(self, dochome: str, decl: str) -> Optional[str]:
+        """Return the url of the documentation of decl, if it is known."""
+        page = self.decls.get(decl)
+        if page is None:
+            return None
+        return f'{dochome}/{self.pages[page]}#{decl}'
+
+
+def load_doc_index(doc_dir: Path, cache_path: Path) -> DocIndex:
+    """
+    Return the index of the declarations documented in doc_dir, which is the
+    output folder of doc-gen4, using the index cached at cache_path if the
+    declaration data did not change since it was written. The index is
+    empty if there is no declaration data.
+    """
+    data_path = doc_dir/DECLARATION_DATA
+    try:
+        stat = data_path.stat()
+    except OSError:
+        log.warning(f'Could not find Lean documentation data in {data_path}, '
+                    'Lean declarations will be linked through the find page.')
+        return DocIndex([], {})
+    key = [str(data_path.resolve()), stat.st_mtime_ns, stat.st_size]
+    try:
+        cache = json.loads(cache_path.read_text(encoding='utf8'))
+        if cache['key'] == key:
+            return DocIndex(cache['pages'], cache['decls'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    try:
+        index = DocIndex.from_declaration_data(data_path)
+    except (OSError, ValueError) as err:
+        log.warning(f'Could not read Lean documentation data in {data_path}: {err}')
+        return DocIndex([], {})
+    write_if_changed(cache_path, json.dumps({'key': key, 'pages': index.pages, 'decls': index.decls},
+                                            separators=(',', ':')))
+    return index
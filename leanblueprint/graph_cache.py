@@ -0,0 +1,161 @@
+"""
+Cache of the Graphviz sources of dependency graphs.
+
+For each dependency graph, the depgraph package builds a pygraphviz graph,
+reduces it using the Graphviz `tred` program and embeds the resulting DOT source
+in the dependency graph page, where it is laid out by the browser. For large
+graphs, this is the slowest part of the Python side of the graph.
+
+The DOT source only depends on the structure of the graph and on the output of
+the colorizers for each node, so we compute a digest of those and reuse the DOT
+source from a previous build when it matches, even if the text of the blueprint
+changed.
+
+When several graphs are not in the cache, for instance when there is one graph
+per chapter, `prefetch_graphs` reduces them in a pool of processes and stores
+the results in the cache before rendering.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from plastexdepgraph.Packages.depgraph import item_kind
+
+from leanblueprint.cache import DiskCache, digest, package_versions
+
+# Bound on the total size of cached graphs.
+GRAPH_CACHE_SIZE = 32*2**20
+
+
+@lru_cache(maxsize=None)
+def graph_package_versions() -> Dict[str, str]:
+    """
+    Return the versions of the packages producing DOT sources. They are only
+    looked up once per process since this is slow compared to a graph key.
+    """
+    return package_versions('plastexdepgraph', 'pygraphviz')
+
+
+def graph_key(graph, shapes: Dict[str, str], dep_graph: Dict[str, Any],
+              versions: Dict[str, str]) -> str:
+    """
+    Return a digest of everything determining the output of graph.to_dot(shapes):
+    the id, shape and colors of each node, the edges between nodes and the
+    versions of the packages producing it. dep_graph is the dictionary holding
+    the colorizers.
+    """
+    colorizer = dep_graph.get('colorizer', lambda node: '')
+    fillcolorizer = dep_graph.get('fillcolorizer', lambda node: '')
+    stylerizer = dep_graph.get('stylerizer', lambda node: None)
+    nodes = sorted([node.id, shapes.get(item_kind(node), 'ellipse'),
+                    colorizer(node), fillcolorizer(node), stylerizer(node)]
+                   for node in graph.nodes)
+    edges = sorted([source.id, target.id, kind]
+                   for kind, edge_set in [('uses', graph.edges), ('proof', graph.proof_edges)]
+                   for source, target in edge_set
+                   if source in graph.nodes and target in graph.nodes)
+    return digest({'nodes': nodes, 'edges': edges,
+                   'versions': versions})
+
+
+class CachedDot:
+    """
+    Stand-in for the pygraphviz graph returned by DepGraph.to_dot, supporting
+    the tred and to_string methods used by the depgraph package. The actual
+    graph is only built when its DOT source is not in the cache, or when
+    other attributes are accessed.
+    """
+
+    def __init__(self, key: str, cache: DiskCache, build: Callable[[], Any]):
+        self._key = key
+        self._cache = cache
+        self._build = build
+        self._graph: Optional[Any] = None
+        self._tred_args: Optional[str] = None
+
+    def tred(self, args: str = '', copy: bool = False) -> 'CachedDot':
+        if copy:
+            return self.graph().tred(args, copy=True)
+        self._tred_args = args
+        return self
+
+    def graph(self) -> Any:
+        """Return the actual pygraphviz graph."""
+        if self._graph is None:
+            self._graph = self._build()
+            if self._tred_args is not None:
+                self._graph = self._graph.tred(self._tred_args)
+        return self._graph
+
+    def cache_key(self) -> str:
+        return digest([self._key, self._tred_args])
+
+    def cached_string(self) -> Optional[str]:
+        """Return the DOT source from the cache, if it is there."""
+        data = self._cache.get(self.cache_key())
+        return None if data is None else data.decode()
+
+    def unreduced_string(self) -> str:
+        """Return the DOT source of the graph before transitive reduction."""
+        return self._build().to_string()
+
+    def store(self, text: str) -> None:
+        """Store text in the cache as the DOT source of this graph."""
+        self._cache.put(self.cache_key(), text.encode())
+
+    def to_string(self) -> str:
+        if self._graph is not None:
+            return self._graph.to_string()
+        text = self.cached_string()
+        if text is None:
+            text = self.graph().to_string()
+            self.store(text)
+        return text
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.graph(), name)
+
+
+def cache_graph(graph, dep_graph: Dict[str, Any], cache: DiskCache) -> None:
+    """Make graph.to_dot use the cache."""
+    to_dot = graph.to_dot
+    versions = graph_package_versions()
+
+    def cached_to_dot(shapes: Dict[str, str]) -> CachedDot:
+        return CachedDot(graph_key(graph, shapes, dep_graph, versions), cache,
+                         partial(to_dot, shapes))
+
+    graph.to_dot = cached_to_dot
+
+
+def reduce_source(source: str, args: str) -> str:
+    """Return the transitive reduction of the graph with DOT source `source`."""
+    from pygraphviz import AGraph
+    return AGraph(string=source).tred(args).to_string()
+
+
+def prefetch_graphs(graphs: Iterable, shapes: Dict[str, str], reduce: bool,
+                    jobs: int) -> None:
+    """
+    Compute the reduced DOT sources of the given graphs, whose to_dot method
+    goes through the cache, using up to jobs processes, and store them in the
+    cache. Graphs which are already in the cache, or which are not reduced,
+    are left alone. Nothing happens unless at least two graphs can be
+    reduced at the same time, otherwise they are computed when needed.
+    """
+    dots = []
+    for graph in graphs:
+        dot = graph.to_dot(shapes)
+        if reduce and isinstance(dot, CachedDot):
+            dot.tred()
+            if dot.cached_string() is None:
+                dots.append(dot)
+    if len(dots) < 2 or jobs < 2:
+        return
+    # The pygraphviz graphs are built in this process since this calls the
+    # colorizers, only the reduction happens in other processes.
+    sources = [dot.unreduced_string() for dot in dots]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(dots))) as pool:
+        reduced = pool.map(reduce_source, sources, [''] * len(sources))
+        for dot, text in zip(dots, reduced):
+            dot.store(text)
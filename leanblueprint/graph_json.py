@@ -0,0 +1,175 @@
+"""
+Compact JSON export of dependency graphs.
+
+The default dependency graph page embeds the DOT source of the graph, which
+is laid out by Graphviz compiled to WebAssembly in the browser, and the modal
+of every node. For large blueprints, this page is huge and takes a long time
+to display. With the `jsongraph` option, each graph is instead written as a
+JSON file holding the id, kind and status of each node, the edges and the
+layout computed by Graphviz during the build. Modal contents are written as
+separate fragments, one per node, which the viewer fetches when a node is
+clicked.
+
+The JSON file has the following keys:
+* bbox: width and height of the graph, in points.
+* kinds: list of pairs made of a node kind and its Graphviz shape.
+* styles: list of triples made of border color, fill color and Graphviz style.
+* nodes: list of [id, kind, status, style, x, y, width, height] where kind and
+  style are indices in the above lists, status is the integer value of the
+  node `NodeStatus` and x, y are the coordinates of the center of the node,
+  with y pointing down.
+* edges: list of [source, target, proof] where source and target are indices
+  in the node list and proof is 1 for edges coming from proofs and 0 for edges
+  coming from statements.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+from plastexdepgraph.Packages.depgraph import item_kind
+
+from leanblueprint.cache import DiskCache, digest, write_if_changed
+from leanblueprint.graph_cache import CachedDot
+from leanblueprint.rendering import add_template, render_batch
+
+NODE_TPL = add_template('graph_node', """
+  <div class="thm" id="{{ thm.id }}">
+    <div class="thm_thmheading">
+      <span class="{{ thm.thmName }}_thmcaption">
+      {{ thm.caption }}
+      </span>
+      {% if thm.ref -%}
+      <span class="{{thm.thmName}}_thmlabel">{{thm.ref}}</span>
+      {%- endif -%}
+      {% if thm.title -%}
+      <span class="{{thm.thmName}}_thmtitle">{{ thm.title }}</span>
+      {%- endif -%}
+    </div>
+    <div class="thm_thmcontent">{{ thm }}</div>
+
+    <a class="latex_link" href="{{ thm.url }}">LaTeX</a>
+    {% for extra in extra_modal_links %}
+    {% include extra %}
+    {% endfor %}
+  </div>
+""")
+
+
+def graph_name(document, section) -> str:
+    """Return the name used by depgraph in the file names of the graph of section."""
+    if section == document:
+        return 'document'
+    return section.counter + '_' + section.ref.textContent
+
+
+def layout(source: str) -> Dict[str, Any]:
+    """
+    Lay out the graph with DOT source `source` using the Graphviz dot program
+    and return its bounding box, the box of each node and its edges.
+    """
+    from pygraphviz import AGraph
+    graph = AGraph(string=source)
+    graph.layout(prog='dot')
+    _, _, width, height = (float(x) for x in graph.graph_attr['bb'].split(','))
+    nodes = dict()
+    for node in graph.nodes():
+        x, y = (float(z) for z in node.attr['pos'].split(','))
+        nodes[str(node)] = [round(x), round(height - y),
+                            round(72*float(node.attr['width'])),
+                            round(72*float(node.attr['height']))]
+    edges = [[str(edge[0]), str(edge[1]), 0 if 'dashed' in (edge.attr['style'] or '') else 1]
+             for edge in graph.edges()]
+    return {'bbox': [round(width), round(height)], 'nodes': nodes, 'edges': edges}
+
+
+def cached_layout(dot: Any, cache: DiskCache) -> Dict[str, Any]:
+    """
+    Return the layout of dot, as returned by DepGraph.to_dot and possibly
+    reduced, using the cache when dot comes from the graph cache.
+    """
+    if not isinstance(dot, CachedDot):
+        return layout(dot.to_string())
+    key = digest([dot.cache_key(), 'layout'])
+    data = cache.get(key)
+    if data is not None:
+        return json.loads(data)
+    result = layout(dot.to_string())
+    cache.put(key, json.dumps(result, separators=(',', ':')).encode())
+    return result
+
+
+def graph_data(graph, shapes: Dict[str, str], dep_graph: Dict[str, Any],
+               graph_layout: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return the JSON data of graph, with the given layout, using the
+    colorizers of dep_graph. Nodes are sorted by id.
+    """
+    colorizer = dep_graph.get('colorizer', lambda node: '')
+    fillcolorizer = dep_graph.get('fillcolorizer', lambda node: '')
+    stylerizer = dep_graph.get('stylerizer', None)
+    kinds: Dict[str, int] = dict()
+    styles: Dict[Any, int] = dict()
+    nodes = []
+    boxes = graph_layout['nodes']
+    for node in sorted(graph.nodes, key=lambda node: node.id):
+        kind = item_kind(node)
+        fillcolor = fillcolorizer(node)
+        if stylerizer is not None:
+            style = stylerizer(node)
+        else:
+            style = 'filled' if fillcolor else ''
+        style_key = (colorizer(node), fillcolor, style or '')
+        nodes.append([node.id,
+                      kinds.setdefault(kind, len(kinds)),
+                      node.userdata.get('status', 0),
+                      styles.setdefault(style_key, len(styles)),
+                      *boxes.get(node.id, [0, 0, 0, 0])])
+    index = {node[0]: i for i, node in enumerate(nodes)}
+    edges = [[index[source], index[target], proof]
+             for source, target, proof in graph_layout['edges']
+             if source in index and target in index]
+    return {'bbox': graph_layout['bbox'],
+            'kinds': [[kind, shapes.get(kind, 'ellipse')] for kind in kinds],
+            'styles': [list(style) for style in styles],
+            'nodes': nodes,
+            'edges': edges}
+
+
+def write_node_fragments(graph, folder: Path, **context: Any) -> None:
+    """
+    Write the modal content of each node of graph in folder, as i.html where
+    i is the index of the node in the JSON data. Fragments of nodes which
+    are no longer in the graph are removed.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    nodes = sorted(graph.nodes, key=lambda node: node.id)
+    names = set()
+    for i, html in enumerate(render_batch(NODE_TPL, nodes, var='thm', **context)):
+        names.add(f'{i}.html')
+        write_if_changed(folder/f'{i}.html', html)
+    for path in folder.glob('*.html'):
+        if path.name not in names:
+            path.unlink()
+
+
+def write_graph_json(document, dep_graph: Dict[str, Any], reduce: bool,
+                     cache: DiskCache) -> List[str]:
+    """
+    Write the JSON data and node fragments of all dependency graphs of
+    document in the current folder and return the names of the JSON files.
+    """
+    shapes = dep_graph.get('shapes', {'definition': 'box'})
+    files = []
+    for section, graph in dep_graph['graphs'].items():
+        name = 'dep_graph_' + graph_name(document, section)
+        dot = graph.to_dot(shapes)
+        if reduce:
+            dot = dot.tred()
+        data = graph_data(graph, shapes, dep_graph, cached_layout(dot, cache))
+        write_if_changed(Path(name + '.json'), json.dumps(data, separators=(',', ':'),
+                                                           ensure_ascii=False))
+        write_node_fragments(graph, Path(name + '_nodes'),
+                             document=document, context=document.context,
+                             extra_modal_links=dep_graph.get('extra_modal_links_tpl', []))
+        files.append(name + '.json')
+    return files
@@ -0,0 +1,136 @@
+"""
+Neighborhood dependency graphs.
+
+For large blueprints, the global dependency graph is hard to read and slow to
+display. With the `neighborhood` option, each node also gets a small graph
+made of the nodes it uses and the nodes using it, up to a given number of
+steps, in a page linked from the header of its statement.
+
+Those graphs are computed from the union of the dependency graphs, with a
+breadth-first search in each direction from each node. They are instances of
+`DepGraph`, so their Graphviz sources go through the graph cache like the
+main graphs, and they are laid out in the browser when their page is opened.
+"""
+import re
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set
+
+from jinja2 import Template
+from plastexdepgraph.Packages.depgraph import DepGraph
+
+from leanblueprint.cache import write_if_changed
+from leanblueprint.graph_json import NODE_TPL
+from leanblueprint.rendering import add_template, render_batch
+from leanblueprint.status import Edge
+
+NEIGHBORHOOD_TPL = Path(__file__).parent/'static'/'dep_graph_neighborhood.html'
+
+NEIGHBORHOOD_LINK_TPL = add_template('neighborhood_link', """
+    {% if obj.userdata.neighborhood_url %}
+    <a class="icon proof" href="{{ obj.userdata.neighborhood_url }}" title="Dependency graph">{{ icon('mindmap') }}</a>
+    {% endif %}
+""")
+
+
+def ball(start, neighbors: Dict[Any, List], radius: int) -> Set:
+    """Return the nodes at distance at most radius from start, following neighbors."""
+    seen = {start}
+    queue = deque([(start, 0)])
+    while queue:
+        node, distance = queue.popleft()
+        if distance == radius:
+            continue
+        for other in neighbors.get(node, []):
+            if other not in seen:
+                seen.add(other)
+                queue.append((other, distance + 1))
+    return seen
+
+
+def inner_edges(nodes: Set, sources: Dict[Any, List]) -> Set[Edge]:
+    """Return the edges between the given nodes, given the sources of the edges reaching each node."""
+    return {(source, target) for target in nodes
+            for source in sources.get(target, []) if source in nodes}
+
+
+def neighborhood_graphs(document, graphs: Iterable[DepGraph],
+                        radius: int) -> Dict[Any, DepGraph]:
+    """
+    Return the neighborhood graph of each node of the given graphs, made of
+    its ancestors and descendants at distance at most radius.
+    """
+    nodes: Dict[Any, None] = dict()
+    edges: Set[Edge] = set()
+    proof_edges: Set[Edge] = set()
+    for graph in graphs:
+        nodes.update(dict.fromkeys(graph.nodes))
+        edges.update(graph.edges)
+        proof_edges.update(graph.proof_edges)
+    predecessors: Dict[Any, List] = dict()
+    successors: Dict[Any, List] = dict()
+    # Predecessors along each kind of edge, to find the edges of each
+    # neighborhood from its nodes rather than among all edges.
+    edge_sources: Dict[Any, List] = dict()
+    proof_edge_sources: Dict[Any, List] = dict()
+    for kind_edges, sources in [(edges, edge_sources), (proof_edges, proof_edge_sources)]:
+        for source, target in kind_edges:
+            if source in nodes and target in nodes:
+                sources.setdefault(target, []).append(source)
+                predecessors.setdefault(target, []).append(source)
+                successors.setdefault(source, []).append(target)
+
+    neighborhoods = dict()
+    for node in nodes:
+        graph = DepGraph()
+        graph.document = document
+        graph.nodes = ball(node, predecessors, radius) | ball(node, successors, radius)
+        graph.edges = inner_edges(graph.nodes, edge_sources)
+        graph.proof_edges = inner_edges(graph.nodes, proof_edge_sources)
+        neighborhoods[node] = graph
+    return neighborhoods
+
+
+def page_names(nodes: Iterable) -> Dict[Any, str]:
+    """
+    Return the name of the neighborhood page of each node, made from its id
+    with characters which are not safe in urls replaced by underscores.
+    """
+    names: Dict[Any, str] = dict()
+    used: Set[str] = set()
+    for node in sorted(nodes, key=lambda node: node.id):
+        base = 'dep_graph_node_' + re.sub(r'[^A-Za-z0-9_.-]', '_', node.id)
+        name, count = base, 1
+        while name in used:
+            count += 1
+            name = f'{base}_{count}'
+        used.add(name)
+        names[node] = name + '.html'
+    return names
+
+
+def write_neighborhood_pages(document, neighborhoods: Dict[Any, DepGraph],
+                             reduce: bool, **context: Any) -> List[str]:
+    """
+    Write the neighborhood page of each node in the current folder and return
+    their names. The statement of each node is rendered once and shared by
+    all pages where it appears.
+    """
+    dep_graph = document.userdata['dep_graph']
+    shapes = dep_graph.get('shapes', {'definition': 'box'})
+    template = Template(NEIGHBORHOOD_TPL.read_text(encoding='utf8'))
+    nodes = list(neighborhoods)
+    modals = dict(zip(nodes, render_batch(
+        NODE_TPL, nodes, var='thm', document=document, context=document.context,
+        extra_modal_links=dep_graph.get('extra_modal_links_tpl', []))))
+    files = []
+    for node, graph in neighborhoods.items():
+        dot = graph.to_dot(shapes)
+        if reduce:
+            dot = dot.tred()
+        name = node.userdata['neighborhood_url']
+        write_if_changed(Path(name), template.render(
+            node=node, graph=graph, dot=dot.to_string(), modals=modals,
+            legend=dep_graph['legend'], document=document, **context))
+        files.append(name)
+    return files
@@ -0,0 +1,179 @@
+"""
+Rendering of the pages of the web version in several processes.
+
+plasTeX parses and renders the blueprint in a single process. Parsing cannot
+be split by chapter since TeX macros, counters and labels defined in a chapter
+are used by the following ones, and the status pass needs the whole
+dependency graph, but once the document is parsed and its post-parse callbacks
+ran, the pages of chapters can be rendered independently.
+
+With the `renderjobs` option, as soon as the renderer assigned a file name to
+each page, the top level pages below the main page (usually chapters) and the
+pages they contain are rendered by a pool of forked processes. The main process
+then renders the remaining pages as usual, reusing the files written by the
+workers, and runs the pre-cleanup callbacks and the final cleanup on all pages.
+
+Generated ids of nodes without a label are assigned before forking so that
+all processes agree on them. Images are generated by the imager of the main
+process, which is created after file names are assigned, so pages containing
+nodes whose template uses images are left to the main process, see
+`image_templates`. Pages whose rendering fails in a worker for another reason
+are rendered again by the main process.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from plasTeX import Macro
+from plasTeX.DOM import Node
+from plasTeX.Logging import getLogger
+from plasTeX.PackageResource import PackageResource
+
+log = getLogger()
+
+# Template name given to pages rendered by workers.
+RENDERED = 'leanblueprint-rendered-page'
+
+# Pages to render, inherited by forked workers.
+_pages: List[Any] = []
+
+
+class Pages:
+    """
+    Stand-in parent of some pages, so that plasTeX renders and writes them
+    with its own rendering loop.
+    """
+    str = None
+    nodeType = Node.ELEMENT_NODE
+
+    def __init__(self, pages: List[Any]) -> None:
+        self.childNodes = pages
+
+    def hasChildNodes(self) -> bool:
+        return bool(self.childNodes)
+
+
+def available() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def generate_ids(node) -> None:
+    """Assign the generated ids of all macros below node, in document order."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Macro):
+            node.id
+        stack.extend(reversed(node.childNodes))
+
+
+def chapter_pages(files: Dict[Any, str]) -> List[Any]:
+    """
+    Return the pages whose closest ancestor having a page is a top level page,
+    in document order, among the nodes of files.
+    """
+    def page_parent(node):
+        node = node.parentNode
+        while node is not None and node not in files:
+            node = node.parentNode
+        return node
+
+    return [node for node in files
+            if (parent := page_parent(node)) is not None and page_parent(parent) is None]
+
+
+def image_templates(renderer) -> Set[str]:
+    """Return the names of the templates of renderer using images."""
+    names = set()
+    for name, template in renderer.items():
+        # plasTeX keeps the source of each template as a default argument
+        # of the function rendering it.
+        source = next((value for value in getattr(template, '__defaults__', None) or ()
+                       if isinstance(value, str)), '')
+        if '.image' in source or '.vectorImage' in source:
+            names.add(name)
+    return names
+
+
+def uses_images(page, templates: Set[str]) -> bool:
+    """Tell whether a node below page is rendered by one of the given templates."""
+    stack = [page]
+    while stack:
+        node = stack.pop()
+        if node.nodeName in templates or getattr(node, 'templateName', None) in templates:
+            return True
+        stack.extend(node.childNodes)
+    return False
+
+
+def render_page(index: int) -> bool:
+    """Render the page _pages[index] and the pages it contains, in a worker."""
+    page = _pages[index]
+    try:
+        Node.renderer.renderableClass.__str__(Pages([page]))
+    except Exception as err:
+        log.info(f'Page {page.filename} will be rendered by the main process: {err}')
+        return False
+    return True
+
+
+def render_pages(document, renderer, jobs: int) -> None:
+    """
+    Render the chapter pages of document using jobs processes, and arrange
+    for the renderer to reuse the resulting files.
+    """
+    global _pages
+    templates = image_templates(renderer)
+    pages = chapter_pages(renderer.files)
+    _pages = [page for page in pages if not uses_images(page, templates)]
+    if len(_pages) < len(pages):
+        log.info(f'{len(pages) - len(_pages)} pages using images will be rendered by the main process.')
+    if jobs < 2 or len(_pages) < 2:
+        _pages = []
+        return
+    generate_ids(document)
+    log.info(f'Rendering {len(_pages)} pages using {min(jobs, len(_pages))} processes.')
+    with ProcessPoolExecutor(max_workers=min(jobs, len(_pages)),
+                             mp_context=multiprocessing.get_context('fork')) as pool:
+        rendered = list(pool.map(render_page, range(len(_pages))))
+    for page, done in zip(_pages, rendered):
+        if done:
+            page.templateName = RENDERED
+    _pages = []
+
+
+def rendered_content(page) -> str:
+    # The content is already in the page file written by a worker.
+    return ''
+
+
+def rendered_layout(static_page) -> str:
+    """Return the page file written by a worker, and forget it was rendered."""
+    page = static_page._node_data[0]
+    del page.templateName
+    path = Path(page.filename)
+    return path.read_text(encoding=page.config['files']['output-encoding'])
+
+
+class ParallelPages(PackageResource):
+    """
+    Package resource rendering chapter pages in jobs processes, right after
+    the renderer assigned file names to pages.
+    """
+
+    def __init__(self, jobs: int) -> None:
+        super().__init__()
+        self.jobs = jobs
+
+    def alterRenderer(self, renderer) -> None:
+        renderer[RENDERED] = rendered_content
+        renderer[RENDERED + '-layout'] = rendered_layout
+        cache_filenames = renderer.cacheFilenames
+
+        def cache_filenames_and_render(node) -> None:
+            cache_filenames(node)
+            if node.nodeType == Node.DOCUMENT_NODE:
+                render_pages(node, renderer, self.jobs)
+
+        renderer.cacheFilenames = cache_filenames_and_render
@@ -0,0 +1,194 @@
+"""
+Profiling of blueprint builds.
+
+When profiling is enabled, build stages record their wall time and the memory
+use (RSS) of their process: client tasks, subprocesses and, inside the plasTeX
+process, the parsing, post-parse callbacks, dependency graph generation and page
+rendering. The plasTeX process learns that it should record its own stages
+from the environment variable `LEANBLUEPRINT_PROFILE`, which holds the path of
+the file where it appends them.
+
+All stages are finally written as a trace in the Chrome trace event format,
+which can be opened in chrome://tracing or https://ui.perfetto.dev, and
+summarized in a table.
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+ENV_VAR = 'LEANBLUEPRINT_PROFILE'
+
+
+def rss() -> int:
+    """Return the resident memory of the current process, in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Fall back to the peak memory, measured in bytes on macOS and kilobytes elsewhere.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+def children_peak_rss() -> int:
+    """Return the peak resident memory of finished subprocesses, in bytes."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+class Profiler:
+    """Record build stages as complete events of the Chrome trace format."""
+
+    def __init__(self, process_name: str) -> None:
+        self.events: List[Dict[str, Any]] = [
+            {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+             'args': {'name': process_name}}]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, category: str, start: float, end: float,
+            **args: Any) -> None:
+        """
+        Record a stage which ran from start to end, given as returned by
+        time.time(), in the current thread.
+        """
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': int(start*1e6), 'dur': int((end - start)*1e6),
+                 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'args': dict(rss=rss(), **args)}
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def stage(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.time(), **args)
+
+    def name_thread(self, name: str) -> None:
+        """Name the current thread in the trace."""
+        with self._lock:
+            self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                                'tid': threading.get_ident(), 'args': {'name': name}})
+
+    def append_to(self, path: Path) -> None:
+        """Append the recorded events to the file at path, one per line."""
+        with path.open('a', encoding='utf8') as f:
+            for event in self.events:
+                f.write(json.dumps(event) + '\n')
+
+
+_profiler: Optional[Profiler] = None
+
+
+def start(events_path: Path) -> Profiler:
+    """
+    Start profiling the current process. Subprocesses write their stages in
+    the file at events_path.
+    """
+    global _profiler
+    _profiler = Profiler('leanblueprint')
+    _profiler.name_thread('main')
+    if events_path.exists():
+        events_path.unlink()
+    os.environ[ENV_VAR] = str(events_path.resolve())
+    return _profiler
+
+
+def active() -> Optional[Profiler]:
+    """Return the profiler of the current process, if profiling is enabled."""
+    return _profiler
+
+
+def from_environment(process_name: str) -> Optional[Profiler]:
+    """
+    Return a profiler for a subprocess of a profiled build, or None if the
+    build is not profiled. The recorded stages are written when the process exits.
+    """
+    global _profiler
+    path = os.environ.get(ENV_VAR)
+    if not path:
+        return None
+    if _profiler is None:
+        _profiler = Profiler(process_name)
+        atexit.register(_profiler.append_to, Path(path))
+    return _profiler
+
+
+@contextmanager
+def stage(name: str, category: str, **args: Any) -> Iterator[None]:
+    """Record a stage if profiling is enabled."""
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.stage(name, category, **args):
+            yield
+
+
+def finish(trace_path: Path, console: Console) -> None:
+    """
+    Stop profiling, write the trace of the current process and its
+    subprocesses to trace_path and print a summary.
+    """
+    global _profiler
+    profiler = _profiler
+    if profiler is None:
+        return
+    _profiler = None
+    events = list(profiler.events)
+    events_path = Path(os.environ.pop(ENV_VAR))
+    if events_path.exists():
+        for line in events_path.read_text(encoding='utf8').splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                pass
+        events_path.unlink()
+    trace_path.write_text(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}),
+                          encoding='utf8')
+
+    stages = sorted((event for event in events if event['ph'] == 'X'),
+                    key=lambda event: event['ts'])
+    if not stages:
+        console.print("No build stage ran.")
+        return
+    origin = stages[0]['ts']
+    process_names = {event['pid']: event['args']['name']
+                     for event in events if event['name'] == 'process_name'}
+    # Stages which run several times, such as callbacks registered once per
+    # command occurrence, are summarized in a single row.
+    rows: Dict[Any, Dict[str, Any]] = dict()
+    for event in stages:
+        row = rows.setdefault((event['name'], event['cat'], event['pid']),
+                              {'start': event['ts'], 'count': 0, 'dur': 0, 'rss': 0})
+        row['count'] += 1
+        row['dur'] += event['dur']
+        row['rss'] = max(row['rss'], event['args'].get('children_peak_rss') or
+                         event['args'].get('rss', 0))
+    table = Table('Stage', 'Kind', 'Process', 'Count', 'Start', 'Time', 'RSS')
+    for (name, category, pid), row in rows.items():
+        table.add_row(name, category, process_names.get(pid, str(pid)), str(row['count']),
+                      f"{(row['start'] - origin)/1e6:.2f}s", f"{row['dur']/1e6:.2f}s",
+                      f"{row['rss']/2**20:.0f}MiB")
+    console.print(table)
+    console.print(f"Trace written to {trace_path}, it can be opened in "
+                  "chrome://tracing or https://ui.perfetto.dev.")
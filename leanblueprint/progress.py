@@ -0,0 +1,127 @@
+"""
+Formalization progress statistics.
+
+`Progress.add` is meant to be given as the on_status callback of
+`propagate_status`, so that statistics are gathered during the status pass.
+The result is written as `progress.json` in the output folder of the web
+version, for use by dashboards and continuous integration. It has the
+following keys:
+* total: number of nodes in each status, and total number of nodes.
+* chapters: list of chapters (or sections when there are no chapters), in
+  order of appearance, with their id, number, title and the counts of their
+  nodes as above. Nodes outside any chapter are counted under a null id.
+* kinds: counts as above for each node kind (definition, lemma...).
+* nodes: list of nodes with their id, kind, chapter id, integer status and
+  status names.
+Status names are the lower case names of the `NodeStatus` flags.
+"""
+import copy
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+from leanblueprint.status import NodeStatus
+
+PROGRESS_FILE = 'progress.json'
+
+STATUS_NAMES = [(flag, flag.name.lower()) for flag in NodeStatus]
+
+
+def empty_counts() -> Dict[str, int]:
+    return dict({name: 0 for _, name in STATUS_NAMES}, total=0)
+
+
+def chapter_of(node) -> Optional[Any]:
+    """Return the outermost chapter or section containing node, if any."""
+    chapter = None
+    while node is not None:
+        if node.nodeName in ('chapter', 'section'):
+            chapter = node
+        node = node.parentNode
+    return chapter
+
+
+def document_position(node) -> List[int]:
+    """
+    Return the position of node in the document, as the index of each of its
+    ancestors (and itself) among its siblings, from the root down. Sorting by
+    position gives the document order, even for chapters in different parts.
+    """
+    position = []
+    while node.parentNode is not None:
+        position.append(next(i for i, child in enumerate(node.parentNode.childNodes)
+                             if child is node))
+        node = node.parentNode
+    return position[::-1]
+
+
+class Progress:
+    """Counts of nodes in each status, per chapter and per kind."""
+
+    def __init__(self, kind: Callable[[Any], str]) -> None:
+        self.kind = kind
+        self.total = empty_counts()
+        self.chapters: Dict[Optional[str], Dict[str, Any]] = dict()
+        # Position of each chapter in the document, to sort them.
+        self.positions: Dict[Optional[str], List[int]] = dict()
+        self.kinds: Dict[str, Dict[str, int]] = dict()
+        self.nodes: List[Dict[str, Any]] = []
+
+    def add(self, node) -> None:
+        """Count node, whose status is final."""
+        status = node.userdata.get('status', 0)
+        names = [name for flag, name in STATUS_NAMES if status & flag]
+        kind = self.kind(node)
+        chapter = chapter_of(node)
+        chapter_id = chapter.id if chapter is not None else None
+        if chapter_id not in self.chapters:
+            title = getattr(chapter, 'title', None)
+            self.chapters[chapter_id] = {
+                'id': chapter_id,
+                'ref': chapter.ref.textContent if chapter is not None and chapter.ref else None,
+                'title': title.textContent if title else None,
+                'counts': empty_counts()}
+            self.positions[chapter_id] = (document_position(chapter) if chapter is not None
+                                          else [-1])
+        for counts in [self.total, self.chapters[chapter_id]['counts'],
+                       self.kinds.setdefault(kind, empty_counts())]:
+            counts['total'] += 1
+            for name in names:
+                counts[name] += 1
+        self.nodes.append({'id': node.id, 'kind': kind, 'chapter': chapter_id,
+                           'status': status, 'flags': names})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'total': self.total,
+                'chapters': sorted(self.chapters.values(),
+                                   key=lambda chapter: self.positions[chapter['id']]),
+                'kinds': self.kinds,
+                'nodes': sorted(self.nodes, key=lambda node: node['id'])}
+
+    def dumps(self) -> str:
+        return dumps(self.as_dict())
+
+
+def dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, indent=1, ensure_ascii=False)
+
+
+def update_statuses(data: Dict[str, Any], statuses: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Return the progress data `data`, as returned by `Progress.as_dict`, with
+    the status of nodes replaced by those given by id in statuses, and counts
+    updated accordingly.
+    """
+    data = copy.deepcopy(data)
+    chapters = {chapter['id']: chapter['counts'] for chapter in data['chapters']}
+    all_counts = [data['total'], *chapters.values(), *data['kinds'].values()]
+    for counts in all_counts:
+        counts.update(dict.fromkeys(counts, 0))
+    for node in data['nodes']:
+        node['status'] = status = statuses.get(node['id'], node['status'])
+        node['flags'] = [name for flag, name in STATUS_NAMES if status & flag]
+        for counts in [data['total'], chapters[node['chapter']],
+                       data['kinds'][node['kind']]]:
+            counts['total'] += 1
+            for name in node['flags']:
+                counts[name] += 1
+    return data
@@ -0,0 +1,92 @@
+"""
+Shared Jinja environment for the small templates of the blueprint package.
+
+Those templates are included by the theorem template of plasTeX and by the
+dependency graph template, once per theorem, so they are all compiled in one
+environment whose bytecode cache persists between builds. Each template is
+instrumented to record how many times it was rendered and how long it took,
+see `render_stats`.
+"""
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from jinja2 import (BytecodeCache, DictLoader, Environment,
+                    FileSystemBytecodeCache, Template)
+from jinja2.runtime import Context
+
+# Prefix of template names, to avoid clashes in the bytecode cache folder
+# which is shared with other applications.
+PREFIX = 'leanblueprint/'
+
+_sources: Dict[str, str] = dict()
+
+
+def _bytecode_cache() -> Optional[BytecodeCache]:
+    try:
+        return FileSystemBytecodeCache()
+    except (OSError, RuntimeError):
+        # No usable temporary folder, templates are compiled each time.
+        return None
+
+
+env = Environment(loader=DictLoader(_sources), bytecode_cache=_bytecode_cache())
+
+
+class RenderStats:
+    """Number of renders of a template and total time spent rendering it."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'seconds': self.seconds}
+
+
+_stats: Dict[str, RenderStats] = dict()
+
+
+def render_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the render count and total render time of each template."""
+    return {name: stats.as_dict() for name, stats in _stats.items()}
+
+
+def reset_render_stats() -> None:
+    for stats in _stats.values():
+        stats.__init__()
+
+
+def add_template(name: str, source: str) -> Template:
+    """
+    Compile source as the template called name in the shared environment
+    and return it, instrumented to record render statistics.
+    """
+    _sources[PREFIX + name] = source
+    template = env.get_template(PREFIX + name)
+    stats = _stats[name] = RenderStats()
+    render_func = template.root_render_func
+
+    # Templates included by other templates are rendered by calling this
+    # function directly, hence instrumenting it rather than Template.render.
+    def timed_render_func(context: Context) -> Iterator[str]:
+        start = time.perf_counter()
+        try:
+            yield from render_func(context)
+        finally:
+            stats.count += 1
+            stats.seconds += time.perf_counter() - start
+
+    template.root_render_func = timed_render_func  # type: ignore
+    return template
+
+
+def render_batch(template: Template, objs: Iterable[Any], var: str = 'obj',
+                 **context: Any) -> List[str]:
+    """
+    Render template once for each of the given objects, bound to the template
+    variable var, in a single pass sharing the rest of the context.
+    """
+    base = dict(template.globals, **context)
+    return [env.concat(template.root_render_func(  # type: ignore
+                template.new_context(dict(base, **{var: obj}), shared=True)))
+            for obj in objs]
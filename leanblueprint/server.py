@@ -0,0 +1,267 @@
+"""
+Local web server showing a compiled blueprint.
+
+Each request is handled in its own thread. Files are sent with an ETag so that
+browsers can cheaply revalidate their cache, text files are compressed (using
+precompressed `.br` or `.gz` siblings when they exist) and byte ranges are
+supported for uncompressed responses.
+
+When given a LiveReload object, the server injects a small script in html
+pages. This script listens to server-sent events and reloads the page each
+time LiveReload.notify is called, typically after a rebuild.
+"""
+import gzip
+import http.server
+import io
+import threading
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+LIVE_RELOAD_PATH = '/__livereload'
+
+LIVE_RELOAD_SCRIPT = f"""
+<script>
+new EventSource("{LIVE_RELOAD_PATH}").onmessage = function () {{ location.reload(); }};
+</script>
+""".encode()
+
+
+# Files smaller than this are not worth compressing.
+MIN_COMPRESS_SIZE = 1024
+
+# Bound on the total size of files compressed on the fly kept in memory.
+COMPRESSED_CACHE_SIZE = 64 * 2**20
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/wasm', 'image/svg+xml')
+
+
+class CompressedCache:
+    """A thread safe cache of gzip compressed files, bounded in total size."""
+
+    def __init__(self, max_size: int = COMPRESSED_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._data: 'OrderedDict[Tuple[str, int, int], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, mtime_ns: int, size: int) -> bytes:
+        """Return the gzip compressed content of the file at path."""
+        key = (str(path), mtime_ns, size)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        data = gzip.compress(path.read_bytes(), compresslevel=6)
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = data
+                self.size += len(data)
+            while self.size > self.max_size and len(self._data) > 1:
+                _, old = self._data.popitem(last=False)
+                self.size -= len(old)
+        return data
+
+
+class LiveReload:
+    """Tell browser tabs connected to the server that they should reload."""
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self.generation = 0
+
+    def notify(self) -> None:
+        """Ask all connected pages to reload."""
+        with self._condition:
+            self.generation += 1
+            self._condition.notify_all()
+
+    def wait(self, generation: int, timeout: float) -> int:
+        """
+        Wait until notify is called, if the current generation is still the
+        given one, or timeout expires. Return the new generation.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.generation != generation, timeout)
+            return self.generation
+
+
+class BlueprintRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serve files from the blueprint web folder, with optional live reload."""
+
+    def __init__(self, *args, live_reload: Optional[LiveReload] = None, **kwargs):
+        self.live_reload = live_reload
+        super().__init__(*args, **kwargs)
+
+    protocol_version = 'HTTP/1.1'
+    compressed_cache = CompressedCache()
+
+    def do_GET(self) -> None:
+        if self.live_reload is None:
+            super().do_GET()
+        elif self.path == LIVE_RELOAD_PATH:
+            self.send_reload_events()
+        else:
+            path = Path(self.translate_path(self.path))
+            if path.is_dir() and self.path.endswith('/'):
+                path = path/'index.html'
+            if path.suffix == '.html' and path.is_file():
+                self.send_html_with_reload(path)
+            else:
+                super().do_GET()
+
+    def send_head(self) -> Optional[BinaryIO]:
+        path = Path(self.translate_path(self.path))
+        if path.is_dir() and self.path.split('?')[0].endswith('/'):
+            path = path/'index.html'
+        if not path.is_file():
+            # Directory redirections and listings, and 404 errors.
+            return super().send_head()
+        stat = path.stat()
+        ctype = self.guess_type(str(path))
+        compressible = (stat.st_size >= MIN_COMPRESS_SIZE and
+                        ctype.startswith(COMPRESSIBLE_TYPES))
+        encoding, body_path = self.choose_encoding(path, stat.st_mtime) if compressible else ('', path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+        if etag in self.headers.get('If-None-Match', '').replace(' ', '').split(','):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        status = HTTPStatus.OK
+        content_range = None
+        body: BinaryIO
+        if encoding and body_path == path:
+            data = self.compressed_cache.get(path, stat.st_mtime_ns, stat.st_size)
+            body = io.BytesIO(data)
+            length = len(data)
+        else:
+            body = body_path.open('rb')
+            length = body_path.stat().st_size
+        byte_range = None if encoding else self.requested_range(length)
+        if byte_range == (-1, -1):
+            body.close()
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{length}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        if byte_range is not None:
+            start, end = byte_range
+            body.seek(start)
+            body = io.BytesIO(body.read(end - start + 1))
+            status = HTTPStatus.PARTIAL_CONTENT
+            content_range = f'bytes {start}-{end}/{length}'
+            length = end - start + 1
+
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Last-Modified', self.date_time_string(int(stat.st_mtime)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Accept-Ranges', 'bytes')
+        if compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        return body
+
+    def choose_encoding(self, path: Path, mtime: float) -> Tuple[str, Path]:
+        """
+        Return the content encoding to use for the file at path, and the file
+        to read. A precompressed sibling is used if it is not older than the
+        file itself. The encoding is empty if the client does not accept
+        compressed responses.
+        """
+        accepted = [enc.split(';')[0].strip()
+                    for enc in self.headers.get('Accept-Encoding', '').split(',')]
+        for encoding, suffix in [('br', '.br'), ('gzip', '.gz')]:
+            if encoding in accepted:
+                sibling = path.with_name(path.name + suffix)
+                if sibling.is_file() and sibling.stat().st_mtime >= mtime:
+                    return encoding, sibling
+        if 'gzip' in accepted:
+            return 'gzip', path
+        return '', path
+
+    def requested_range(self, length: int) -> Optional[Tuple[int, int]]:
+        """
+        Return the first and last byte of the range requested by the client,
+        None if there is no (supported) range request or (-1, -1) if the
+        range cannot be satisfied. Only single ranges are supported.
+        """
+        header = self.headers.get('Range', '')
+        if not header.startswith('bytes=') or ',' in header:
+            return None
+        first, _, last = header[len('bytes='):].strip().partition('-')
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last), length - 1) if last else length - 1
+            else:
+                start = max(length - int(last), 0)
+                end = length - 1
+        except ValueError:
+            return None
+        if start > end or start >= length:
+            return (-1, -1)
+        return start, end
+
+    def send_html_with_reload(self, path: Path) -> None:
+        content = path.read_bytes()
+        end = content.rfind(b'</body>')
+        if end == -1:
+            end = len(content)
+        content = content[:end] + LIVE_RELOAD_SCRIPT + content[end:]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_reload_events(self) -> None:
+        assert self.live_reload is not None
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        # The response has no length, it ends when the connection is closed.
+        self.close_connection = True
+        generation = self.live_reload.generation
+        try:
+            while True:
+                new_generation = self.live_reload.wait(generation, timeout=15)
+                if new_generation == generation:
+                    # Comment lines keep the connection alive.
+                    self.wfile.write(b': ping\n\n')
+                else:
+                    generation = new_generation
+                    self.wfile.write(b'data: reload\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(directory: Path,
+                live_reload: Optional[LiveReload] = None) -> Optional[http.server.ThreadingHTTPServer]:
+    """
+    Create a server for the given directory on the first available port
+    between 8000 and 8009, or return None if none is available.
+    """
+    handler = partial(BlueprintRequestHandler,
+                      directory=str(directory), live_reload=live_reload)
+    for port in range(8000, 8010):
+        try:
+            return http.server.ThreadingHTTPServer(("", port), handler)
+        except OSError:
+            pass
+    return None
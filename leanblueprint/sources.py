@@ -0,0 +1,42 @@
+"""
+Reading blueprint sources without TeX.
+
+Some build steps only need to find a few commands in the TeX sources of a
+blueprint, for instance citations or status markers. They read the flat source
+of a document: its text with comments removed and each `\\input` or
+`\\include` command replaced by the flat source of the file it refers to.
+"""
+import re
+from pathlib import Path
+from typing import List, Optional
+
+COMMENT = re.compile(r'(?<!\\)%.*')
+
+INPUT = re.compile(r'\\(?:input|include)\s*\{([^}]*)\}')
+
+
+def input_path(src: Path, name: str) -> Path:
+    """Return the path of the file input as name, relative to src."""
+    path = src/name.strip()
+    if path.suffix != '.tex' and not path.is_file():
+        path = path.with_name(path.name + '.tex')
+    return path
+
+
+def flat_source(path: Path, src: Path, inputs: Optional[List[Path]] = None) -> str:
+    """
+    Return the flat source of the TeX file at path, whose inputs are relative
+    to src. Files which cannot be read, for instance files found by TeX in its
+    own search path, are replaced by nothing, as well as recursive inputs.
+    inputs is the list of files being read, used for recursion.
+    """
+    inputs = inputs or []
+    if path in inputs:
+        return ''
+    try:
+        text = COMMENT.sub('', path.read_text(encoding='utf8', errors='replace'))
+    except OSError:
+        return ''
+    return INPUT.sub(lambda match: flat_source(input_path(src, match.group(1)), src,
+                                               [*inputs, path]),
+                     text)
@@ -0,0 +1,275 @@
+// Viewer for dependency graphs exported as JSON by the jsongraph option of
+// the blueprint package, see leanblueprint/graph_json.py for the data format.
+// The graph is drawn on a canvas, only nodes and edges intersecting the visible
+// area are drawn, in chunks spread over several animation frames so that the
+// page stays responsive. The statement of a node is fetched when it is clicked.
+(function () {
+  "use strict";
+
+  // Number of nodes or edges drawn per animation frame.
+  const CHUNK = 2000;
+  // Labels are not drawn when they would be smaller than this, in pixels.
+  const MIN_FONT_SIZE = 5;
+  const FONT_SIZE = 14;
+
+  const container = document.getElementById("graph");
+  const statements = document.getElementById("statements");
+  const modal = statements.querySelector(".dep-modal-container");
+  const modalBody = statements.querySelector(".dep-modal-body");
+  const canvas = document.createElement("canvas");
+  canvas.style.display = "block";
+  container.appendChild(canvas);
+  const ctx = canvas.getContext("2d");
+
+  let graph = null;
+  // Graph coordinates of the top left corner of the view, and pixels per point.
+  const view = { x: 0, y: 0, scale: 1 };
+  // Incremented at each redraw request, to interrupt outdated drawings.
+  let generation = 0;
+  const fragments = new Map();
+
+  function resize() {
+    const ratio = window.devicePixelRatio || 1;
+    canvas.width = container.clientWidth * ratio;
+    canvas.height = container.clientHeight * ratio;
+    canvas.style.width = container.clientWidth + "px";
+    canvas.style.height = container.clientHeight + "px";
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+  }
+
+  function fit() {
+    const [width, height] = graph.bbox;
+    const scale = Math.min(container.clientWidth / Math.max(width, 1),
+                           container.clientHeight / Math.max(height, 1));
+    view.scale = Math.min(scale, 2);
+    view.x = (width - container.clientWidth / view.scale) / 2;
+    view.y = (height - container.clientHeight / view.scale) / 2;
+  }
+
+  function visibleArea() {
+    return {
+      left: view.x,
+      top: view.y,
+      right: view.x + container.clientWidth / view.scale,
+      bottom: view.y + container.clientHeight / view.scale,
+    };
+  }
+
+  function nodeVisible(node, area) {
+    const [, , , , x, y, w, h] = node;
+    return x + w / 2 >= area.left && x - w / 2 <= area.right &&
+      y + h / 2 >= area.top && y - h / 2 <= area.bottom;
+  }
+
+  function edgeVisible(edge, area) {
+    const source = graph.nodes[edge[0]];
+    const target = graph.nodes[edge[1]];
+    return Math.max(source[4], target[4]) >= area.left &&
+      Math.min(source[4], target[4]) <= area.right &&
+      Math.max(source[5], target[5]) >= area.top &&
+      Math.min(source[5], target[5]) <= area.bottom;
+  }
+
+  // Distance from the center of node to its boundary in direction (dx, dy),
+  // as a multiple of (dx, dy).
+  function boundary(node, dx, dy) {
+    const a = node[6] / 2;
+    const b = node[7] / 2;
+    if (graph.kinds[node[1]][1] === "box") {
+      return Math.min(dx ? a / Math.abs(dx) : Infinity, dy ? b / Math.abs(dy) : Infinity);
+    }
+    return 1 / Math.sqrt((dx / a) ** 2 + (dy / b) ** 2);
+  }
+
+  function drawEdge(edge) {
+    const source = graph.nodes[edge[0]];
+    const target = graph.nodes[edge[1]];
+    const dx = target[4] - source[4];
+    const dy = target[5] - source[5];
+    if (!dx && !dy) {
+      return;
+    }
+    const start = boundary(source, dx, dy);
+    const end = 1 - boundary(target, -dx, -dy);
+    const x0 = source[4] + start * dx;
+    const y0 = source[5] + start * dy;
+    const x1 = source[4] + end * dx;
+    const y1 = source[5] + end * dy;
+    ctx.setLineDash(edge[2] ? [] : [5, 3]);
+    ctx.beginPath();
+    ctx.moveTo(x0, y0);
+    ctx.lineTo(x1, y1);
+    ctx.stroke();
+    const angle = Math.atan2(y1 - y0, x1 - x0);
+    ctx.setLineDash([]);
+    ctx.beginPath();
+    ctx.moveTo(x1 - 9 * Math.cos(angle - 0.4), y1 - 9 * Math.sin(angle - 0.4));
+    ctx.lineTo(x1, y1);
+    ctx.lineTo(x1 - 9 * Math.cos(angle + 0.4), y1 - 9 * Math.sin(angle + 0.4));
+    ctx.stroke();
+  }
+
+  function drawNode(node, labels) {
+    const [id, kind, , style, x, y, w, h] = node;
+    const [color, fillcolor, styleName] = graph.styles[style];
+    ctx.beginPath();
+    if (graph.kinds[kind][1] === "box") {
+      ctx.rect(x - w / 2, y - h / 2, w, h);
+    } else {
+      ctx.ellipse(x, y, w / 2, h / 2, 0, 0, 2 * Math.PI);
+    }
+    ctx.fillStyle = styleName.includes("filled") && fillcolor ? fillcolor : "white";
+    ctx.fill();
+    ctx.setLineDash(styleName.includes("dashed") ? [5, 3] : []);
+    ctx.lineWidth = 1.8;
+    ctx.strokeStyle = color || "black";
+    ctx.stroke();
+    if (labels) {
+      ctx.fillStyle = "black";
+      ctx.fillText(id.split(":").pop(), x, y, w);
+    }
+  }
+
+  // Draw the visible part of the graph, a chunk at a time.
+  function draw() {
+    const current = ++generation;
+    const area = visibleArea();
+    const edges = graph.edges.filter((edge) => edgeVisible(edge, area));
+    const nodes = graph.nodes.filter((node) => nodeVisible(node, area));
+    const labels = FONT_SIZE * view.scale >= MIN_FONT_SIZE;
+    let done = 0;
+
+    function step() {
+      if (current !== generation) {
+        return;
+      }
+      ctx.save();
+      if (done === 0) {
+        ctx.clearRect(0, 0, container.clientWidth, container.clientHeight);
+      }
+      ctx.scale(view.scale, view.scale);
+      ctx.translate(-view.x, -view.y);
+      ctx.font = FONT_SIZE + "px serif";
+      ctx.textAlign = "center";
+      ctx.textBaseline = "middle";
+      const stop = Math.min(done + CHUNK, edges.length + nodes.length);
+      ctx.lineWidth = 1;
+      ctx.strokeStyle = "black";
+      for (; done < Math.min(stop, edges.length); done++) {
+        drawEdge(edges[done]);
+      }
+      for (; done < stop; done++) {
+        drawNode(nodes[done - edges.length], labels);
+      }
+      ctx.restore();
+      if (done < edges.length + nodes.length) {
+        window.requestAnimationFrame(step);
+      }
+    }
+    window.requestAnimationFrame(step);
+  }
+
+  function graphPoint(event) {
+    const rect = canvas.getBoundingClientRect();
+    return [view.x + (event.clientX - rect.left) / view.scale,
+            view.y + (event.clientY - rect.top) / view.scale];
+  }
+
+  function nodeAt(x, y) {
+    for (let i = graph.nodes.length - 1; i >= 0; i--) {
+      const node = graph.nodes[i];
+      const dx = x - node[4];
+      const dy = y - node[5];
+      if (Math.abs(dx) <= node[6] / 2 && Math.abs(dy) <= node[7] / 2) {
+        return i;
+      }
+    }
+    return -1;
+  }
+
+  function typeset(element) {
+    if (!window.MathJax) {
+      return;
+    }
+    if (MathJax.typesetPromise) {
+      MathJax.typesetPromise([element]);
+    } else if (MathJax.Hub) {
+      MathJax.Hub.Queue(["Typeset", MathJax.Hub, element]);
+    }
+  }
+
+  function showNode(i) {
+    if (!fragments.has(i)) {
+      fragments.set(i, fetch(container.dataset.nodes + "/" + i + ".html")
+        .then((response) => response.text()));
+    }
+    fragments.get(i).then((html) => {
+      modalBody.innerHTML = html;
+      statements.style.display = "block";
+      modal.style.display = "block";
+      typeset(modalBody);
+    });
+  }
+
+  function interactive() {
+    let drag = null;
+    canvas.addEventListener("mousedown", (event) => {
+      drag = { x: event.clientX, y: event.clientY, moved: false };
+    });
+    window.addEventListener("mousemove", (event) => {
+      if (!drag) {
+        return;
+      }
+      const dx = event.clientX - drag.x;
+      const dy = event.clientY - drag.y;
+      if (drag.moved || Math.abs(dx) + Math.abs(dy) > 3) {
+        drag.moved = true;
+        view.x -= dx / view.scale;
+        view.y -= dy / view.scale;
+        drag.x = event.clientX;
+        drag.y = event.clientY;
+        draw();
+      }
+    });
+    window.addEventListener("mouseup", (event) => {
+      if (drag && !drag.moved) {
+        const i = nodeAt(...graphPoint(event));
+        if (i >= 0) {
+          showNode(i);
+        }
+      }
+      drag = null;
+    });
+    canvas.addEventListener("wheel", (event) => {
+      event.preventDefault();
+      const [x, y] = graphPoint(event);
+      view.scale *= Math.exp(-event.deltaY / 500);
+      const rect = canvas.getBoundingClientRect();
+      view.x = x - (event.clientX - rect.left) / view.scale;
+      view.y = y - (event.clientY - rect.top) / view.scale;
+      draw();
+    }, { passive: false });
+    window.addEventListener("resize", () => {
+      resize();
+      draw();
+    });
+    document.getElementById("legend_title").addEventListener("click", function () {
+      const legend = this.parentNode.querySelector("dl");
+      legend.style.display = legend.style.display === "block" ? "none" : "block";
+    });
+    statements.querySelector(".dep-closebtn").addEventListener("click", () => {
+      modal.style.display = "none";
+      statements.style.display = "none";
+    });
+  }
+
+  fetch(container.dataset.graph)
+    .then((response) => response.json())
+    .then((data) => {
+      graph = data;
+      resize();
+      fit();
+      interactive();
+      draw();
+    });
+})();
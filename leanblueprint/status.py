@@ -0,0 +1,135 @@
+"""
+Formalization status of dependency graph nodes.
+
+The status of a node is stored in its userdata dictionary, using the keys
+`can_state`, `can_prove`, `proved` and `fully_proved`, and packed as
+`NodeStatus` flags under the key `status`. The first three only depend on the
+node itself and the nodes it directly uses. The last one depends on all
+ancestors of the node. Instead of computing the ancestors of every node, we
+make a single pass over the union of all dependency graphs in topological order,
+so that the cost is linear in the number of nodes and edges and each node is
+handled once even if it appears in several graphs.
+"""
+from collections import deque
+from enum import IntFlag
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from plasTeX.Logging import getLogger
+
+log = getLogger()
+
+Edge = Tuple[Any, Any]
+
+
+class NodeStatus(IntFlag):
+    """
+    Formalization status of a node. The integer value of a combination of
+    these flags is stored as `node.userdata['status']`, it can be used as an
+    index into tables of size `STATUS_COUNT`.
+    """
+    STATED = 1
+    MATHLIB = 2
+    CAN_STATE = 4
+    CAN_PROVE = 8
+    PROVED = 16
+    FULLY_PROVED = 32
+    NOT_READY = 64
+    DEFINITION = 128
+
+
+STATUS_COUNT = 2**len(NodeStatus)
+
+
+def graph_union(graphs: Iterable) -> Tuple[List, Set[Edge]]:
+    """
+    Return the nodes and edges (including proof edges) of the union
+    of the given dependency graphs. Nodes are listed once, in the order
+    in which they are first met.
+    """
+    nodes: Dict[Any, None] = dict()
+    edges: Set[Edge] = set()
+    for graph in graphs:
+        nodes.update(dict.fromkeys(graph.nodes))
+        edges.update(graph.edges)
+        edges.update(graph.proof_edges)
+    return list(nodes), edges
+
+
+def propagate_status(nodes: List, edges: Set[Edge],
+                     is_definition: Callable[[Any], bool],
+                     on_status: Optional[Callable[[Any], None]] = None) -> None:
+    """
+    Compute the formalization status of the given nodes and store it in
+    their userdata. Each edge is a pair (source, target) meaning that
+    target depends on source. Sources which are not among the given nodes
+    are treated as leaves: their own ancestors are not considered.
+    If on_status is given, it is called on each node as soon as its status
+    is final, so that statistics can be gathered in the same pass.
+
+    Nodes which are part of a dependency cycle are never fully proved.
+    """
+    fully_proved = dict()
+    for node in nodes:
+        data = node.userdata
+        status = 0
+        if data.get('leanok'):
+            status |= NodeStatus.STATED
+        if data.get('mathlibok'):
+            status |= NodeStatus.MATHLIB
+        if data.get('notready'):
+            status |= NodeStatus.NOT_READY
+        if is_definition(node):
+            status |= NodeStatus.DEFINITION
+        used = data.get('uses', [])
+        data['can_state'] = all(thm.userdata.get('leanok')
+                                for thm in used) and not data.get('notready', False)
+        proof = data.get('proved_by')
+        if proof:
+            data['can_prove'] = all(thm.userdata.get('leanok')
+                                    for thm in used + proof.userdata.get('uses', []))
+            data['proved'] = proof.userdata.get('leanok', False)
+        else:
+            data['can_prove'] = False
+            data['proved'] = False
+        if data['can_state']:
+            status |= NodeStatus.CAN_STATE
+        if data['can_prove']:
+            status |= NodeStatus.CAN_PROVE
+        if data['proved']:
+            status |= NodeStatus.PROVED
+        data['status'] = int(status)
+        fully_proved[node] = bool(status & (NodeStatus.PROVED | NodeStatus.DEFINITION))
+
+    successors: Dict[Any, List] = {node: [] for node in nodes}
+    indegree = dict.fromkeys(nodes, 0)
+    for source, target in edges:
+        if target not in indegree:
+            continue
+        if source in indegree:
+            successors[source].append(target)
+            indegree[target] += 1
+        elif not (source.userdata.get('proved', False) or is_definition(source)):
+            fully_proved[target] = False
+
+    ready = deque(node for node, degree in indegree.items() if degree == 0)
+    while ready:
+        node = ready.popleft()
+        if fully_proved[node]:
+            node.userdata['status'] |= NodeStatus.FULLY_PROVED.value
+        node.userdata['fully_proved'] = fully_proved[node]
+        if on_status is not None:
+            on_status(node)
+        for target in successors[node]:
+            fully_proved[target] = fully_proved[target] and fully_proved[node]
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                ready.append(target)
+
+    cyclic = [node for node, degree in indegree.items() if degree > 0]
+    if cyclic:
+        log.warning('Dependency cycle involving ' +
+                    ', '.join(sorted(node.id for node in cyclic)))
+        for node in cyclic:
+            node.userdata['fully_proved'] = False
+            if on_status is not None:
+                on_status(node)
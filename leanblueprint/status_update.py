@@ -0,0 +1,316 @@
+"""
+Status-only updates of the web version.
+
+As a Lean formalization progresses, its blueprint sources often change only
+by the addition or removal of `\\leanok`, `\\mathlibok` and `\\notready`
+markers. Those markers do not change the structure of the document, only the
+status of nodes, which shows in the checkmarks of statements, the colors of
+dependency graphs and `progress.json`. Instead of running plasTeX again, such
+changes are applied to the output of the previous build.
+
+At the end of each build, the blueprint package writes a snapshot in the
+output folder. It records each environment which can hold markers (statements
+whose kind appears in dependency graphs, and proofs) with its markers, what it
+uses and the page where it is rendered, together with the dependency graphs,
+the pages showing them and the node colors of each status. The snapshot is only
+written when the markers found by plasTeX agree with those found by reading the
+sources, see `scan_markers`, since updates rely on the latter.
+
+The client records a digest of the sources with markers removed, see
+`skeleton`. When this digest did not change while the sources did, it calls
+`update_web`, which reads the markers of the sources, recomputes statuses with
+`propagate_status` and patches the pages, JSON graphs and `progress.json`.
+"""
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from plasTeX.Logging import getLogger
+from plastexdepgraph.Packages.depgraph import item_kind
+
+from leanblueprint.cache import digest, write_if_changed
+from leanblueprint.graph_json import graph_name
+from leanblueprint.progress import PROGRESS_FILE, dumps, update_statuses
+from leanblueprint.rendering import add_template
+from leanblueprint.sources import flat_source
+from leanblueprint.status import graph_union, propagate_status
+
+log = getLogger()
+
+# Snapshot of the last build, in the output folder.
+SNAPSHOT = '.status_snapshot.json'
+
+MARKERS = ['leanok', 'mathlibok', 'notready']
+
+MARKER = re.compile(r'\\(leanok|mathlibok|notready)(?![A-Za-z@])')
+
+TOKEN = re.compile(r'\\(begin|end)\s*\{([^}]*)\}|' + MARKER.pattern)
+
+DOT = re.compile(r'(renderDot\(`)(.*?)(`\))', re.S)
+
+CHECKMARK_TPL = add_template('checkmark', """
+    {% if obj.userdata.leanok and ('proved_by' not in obj.userdata or obj.userdata.proved_by.userdata.leanok ) %}
+    ✓
+    {% endif %}
+""")
+
+HEADER_EXTRAS = '<div class="thm_header_extras">'
+
+
+def marker_flags(markers: List[str]) -> List[str]:
+    """Return the userdata flags set by markers, \\mathlibok also sets leanok."""
+    if 'mathlibok' in markers:
+        markers = [*markers, 'leanok']
+    return [flag for flag in MARKERS if flag in markers]
+
+
+def scan_markers(src: Path, names: Set[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Return the name and flags of each environment of `web.tex` in src whose
+    name is in names, in document order. A marker belongs to the innermost
+    environment containing it. Raise ValueError if environments are unbalanced.
+    """
+    environments: List[Tuple[str, List[str]]] = []
+    stack: List[Tuple[str, Optional[int]]] = []
+    for match in TOKEN.finditer(flat_source(src/'web.tex', src)):
+        command, name, marker = match.groups()
+        if command == 'begin':
+            index = None
+            if name in names:
+                index = len(environments)
+                environments.append((name, []))
+            stack.append((name, index))
+        elif command == 'end':
+            if not stack or stack[-1][0] != name:
+                raise ValueError(f'unbalanced environment {name}')
+            stack.pop()
+        elif stack and stack[-1][1] is not None:
+            environments[stack[-1][1]][1].append(marker)
+    return [(name, marker_flags(markers)) for name, markers in environments]
+
+
+def skeleton(text: str) -> str:
+    """
+    Return the TeX source text without status markers, dropping lines which
+    only held markers, so that adding or removing markers does not change it.
+    """
+    lines = []
+    for line in text.splitlines():
+        stripped = MARKER.sub('', line)
+        if stripped == line or stripped.strip():
+            lines.append(stripped)
+    return '\n'.join(lines)
+
+
+def skeleton_digests(src: Path, sources: Dict[str, str]) -> Dict[str, str]:
+    """
+    Return sources, mapping file paths relative to src to digests, with the
+    digest of each TeX file replaced by the digest of its skeleton.
+    """
+    return {name: digest(skeleton((src/name).read_text(encoding='utf8', errors='replace')))
+            if name.endswith('.tex') else value
+            for name, value in sources.items()}
+
+
+def page_of(node) -> Optional[str]:
+    """Return the name of the page where node is rendered."""
+    while node is not None and not getattr(node, 'filename', None):
+        node = node.parentNode
+    return node.filename if node is not None else None
+
+
+def snapshot(document, border_colors: List[str],
+             fill_colors: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Return the snapshot of the rendered document, or None if its statuses
+    cannot be updated without plasTeX.
+    """
+    dep_graph = document.userdata['dep_graph']
+    if 'stylerizer' in dep_graph or document.userdata.get('thm_header_extras_tpl') != [
+            CHECKMARK_TPL]:
+        log.info('Statuses cannot be updated without plasTeX: custom node styles or headers.')
+        return None
+    names = [*dep_graph['thm_types'], 'proof']
+    nodes = document.getElementsByTagName(names)
+    try:
+        scanned = scan_markers(Path(document.userdata['working-dir']), set(names))
+    except ValueError as err:
+        log.info(f'Statuses cannot be updated without plasTeX: {err}.')
+        return None
+    flags = [[flag for flag in MARKERS if node.userdata.get(flag)] for node in nodes]
+    if scanned != list(zip((node.tagName for node in nodes), flags)):
+        log.info('Statuses cannot be updated without plasTeX: '
+                 'some status markers are not found by reading the sources.')
+        return None
+    index = {node: i for i, node in enumerate(nodes)}
+    try:
+        environments = []
+        for node, node_flags in zip(nodes, flags):
+            entry: Dict[str, Any] = {'name': node.tagName, 'flags': node_flags,
+                                     'uses': [index[used] for used in node.userdata.get('uses', [])]}
+            if node.tagName != 'proof':
+                proof = node.userdata.get('proved_by')
+                entry.update(id=node.id, page=page_of(node),
+                             definition=item_kind(node) == 'definition',
+                             proof=index[proof] if proof is not None else None)
+            environments.append(entry)
+        graph_nodes, edges = graph_union(dep_graph['graphs'].values())
+        graph_nodes.sort(key=index.__getitem__)
+        dot_pages, json_graphs = dict(), []
+        for section, graph in dep_graph['graphs'].items():
+            name = 'dep_graph_' + graph_name(document, section)
+            if hasattr(graph, 'json_name'):
+                json_graphs.append(name + '.json')
+            else:
+                dot_pages[name + '.html'] = sorted(index[node] for node in graph.nodes)
+        for node, graph in dep_graph.get('neighborhoods', {}).items():
+            dot_pages[node.userdata['neighborhood_url']] = sorted(index[node]
+                                                                 for node in graph.nodes)
+        return {'environments': environments,
+                'nodes': [index[node] for node in graph_nodes],
+                'edges': sorted([index[source], index[target]] for source, target in edges),
+                'statuses': [node.userdata.get('status', 0) for node in graph_nodes],
+                'border_colors': border_colors,
+                'fill_colors': fill_colors,
+                'dot_pages': dot_pages,
+                'json_graphs': json_graphs}
+    except KeyError:
+        log.info('Statuses cannot be updated without plasTeX: '
+                 'the dependency graphs use nodes which are not statements.')
+        return None
+
+
+def write_snapshot(document, border_colors: List[str], fill_colors: List[str]) -> None:
+    """Write the snapshot of the rendered document in the current folder, if any."""
+    data = snapshot(document, border_colors, fill_colors)
+    if data is not None:
+        write_if_changed(Path(SNAPSHOT), json.dumps(data, separators=(',', ':')))
+    elif Path(SNAPSHOT).exists():
+        Path(SNAPSHOT).unlink()
+
+
+class Item:
+    """Stand-in for a node of the document, holding its status userdata."""
+
+    def __init__(self, entry: Dict[str, Any]) -> None:
+        self.id = entry.get('id')
+        self.definition = entry.get('definition', False)
+        self.userdata: Dict[str, Any] = dict.fromkeys(entry['flags'], True)
+
+
+def items(environments: List[Dict[str, Any]]) -> List[Item]:
+    """Return stand-ins for environments, linked to what they use and their proofs."""
+    result = [Item(entry) for entry in environments]
+    for item, entry in zip(result, environments):
+        item.userdata['uses'] = [result[i] for i in entry['uses']]
+        if entry.get('proof') is not None:
+            item.userdata['proved_by'] = result[entry['proof']]
+    return result
+
+
+def statuses(data: Dict[str, Any], environments: List[Item]) -> List[int]:
+    """Return the status of each node of the dependency graphs of the snapshot data."""
+    nodes = [environments[i] for i in data['nodes']]
+    propagate_status(nodes, {(environments[source], environments[target])
+                             for source, target in data['edges']},
+                     lambda item: item.definition)
+    return [node.userdata['status'] for node in nodes]
+
+
+def replace_checkmark(text: str, node_id: str, old: str, new: str) -> str:
+    """Replace the checkmark old of the statement with id node_id in the page text by new."""
+    position = text.find(f'id="{node_id}"')
+    start = text.find(HEADER_EXTRAS, position) + len(HEADER_EXTRAS)
+    end = text.find('</div>', start)
+    if position < 0 or start < len(HEADER_EXTRAS) or '_thmwrapper' in text[position:start] or \
+            old not in text[start:end]:
+        raise ValueError(f'cannot find the header of {node_id}')
+    return text[:start] + text[start:end].replace(old, new, 1) + text[end:]
+
+
+def recolor_dot(source: str, colors: Dict[str, Tuple[str, str]]) -> str:
+    """
+    Return the DOT source with the border and fill colors of the nodes given
+    by id in colors replaced, as the depgraph plugin would set them.
+    """
+    from pygraphviz import AGraph
+    graph = AGraph(string=source)
+    for node_id, (color, fillcolor) in colors.items():
+        if graph.has_node(node_id):
+            attr = graph.get_node(node_id).attr
+            attr.update(color=color, fillcolor=fillcolor, style='filled' if fillcolor else '')
+    return graph.to_string().replace('\n', '')
+
+
+def restyle_graph(data: Dict[str, Any], statuses: Dict[str, int],
+                  border_colors: List[str], fill_colors: List[str]) -> None:
+    """Set the status of nodes of the JSON graph data and recompute their styles."""
+    styles: Dict[Tuple[str, str, str], int] = dict()
+    for node in data['nodes']:
+        node[2] = statuses.get(node[0], node[2])
+        color, fillcolor = border_colors[node[2]], fill_colors[node[2]]
+        node[3] = styles.setdefault((color, fillcolor, 'filled' if fillcolor else ''),
+                                    len(styles))
+    data['styles'] = [list(style) for style in styles]
+
+
+def update_web(src: Path, web_dir: Path) -> int:
+    """
+    Apply the status markers of the blueprint sources in src to the web version
+    in web_dir, using the snapshot of its last build, and return the number of
+    nodes whose status changed. Raise ValueError if this is not possible.
+    """
+    try:
+        data = json.loads((web_dir/SNAPSHOT).read_text(encoding='utf8'))
+    except (OSError, ValueError):
+        raise ValueError('there is no snapshot of the last build')
+    environments = data['environments']
+    scanned = scan_markers(src, {entry['name'] for entry in environments})
+    if [name for name, _ in scanned] != [entry['name'] for entry in environments]:
+        raise ValueError('environments were added or removed')
+    old_items = items(environments)
+    for entry, (_, flags) in zip(environments, scanned):
+        entry['flags'] = flags
+    new_items = items(environments)
+    new_statuses = statuses(data, new_items)
+    border_colors, fill_colors = data['border_colors'], data['fill_colors']
+
+    pages: Dict[str, str] = dict()
+
+    def page(name: str) -> str:
+        if name not in pages:
+            pages[name] = (web_dir/name).read_text(encoding='utf8')
+        return pages[name]
+
+    for entry, old, new in zip(environments, old_items, new_items):
+        if old.id is None:
+            continue
+        old_mark, new_mark = CHECKMARK_TPL.render(obj=old), CHECKMARK_TPL.render(obj=new)
+        if old_mark != new_mark and entry['page']:
+            pages[entry['page']] = replace_checkmark(page(entry['page']), old.id,
+                                                     old_mark, new_mark)
+
+    changed = {i: status for i, old_status, status
+               in zip(data['nodes'], data['statuses'], new_statuses) if old_status != status}
+    for name, nodes in data['dot_pages'].items():
+        colors = {new_items[i].id: (border_colors[changed[i]], fill_colors[changed[i]])
+                  for i in nodes if i in changed}
+        if colors and (web_dir/name).exists():
+            pages[name] = DOT.sub(lambda match: match.group(1) + recolor_dot(match.group(2), colors)
+                                  + match.group(3), page(name))
+
+    by_id = {new_items[i].id: status for i, status in zip(data['nodes'], new_statuses)}
+    graphs = dict()
+    for name in data['json_graphs']:
+        graph = json.loads((web_dir/name).read_text(encoding='utf8'))
+        restyle_graph(graph, by_id, border_colors, fill_colors)
+        graphs[name] = json.dumps(graph, separators=(',', ':'), ensure_ascii=False)
+    progress = update_statuses(
+        json.loads((web_dir/PROGRESS_FILE).read_text(encoding='utf8')), by_id)
+
+    for name, text in [*pages.items(), *graphs.items(), (PROGRESS_FILE, dumps(progress))]:
+        write_if_changed(web_dir/name, text)
+    data['statuses'] = new_statuses
+    write_if_changed(web_dir/SNAPSHOT, json.dumps(data, separators=(',', ':')))
+    return len(changed)
@@ -0,0 +1,132 @@
+"""
+A small scheduler running build steps concurrently while respecting their
+dependencies.
+
+Shell commands launched with `run_command` from a task have their output
+prefixed with the task name, so that the outputs of concurrent tasks can be
+told apart.
+"""
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from rich.console import Console
+from rich.table import Table
+
+from leanblueprint import profiling
+
+_current = threading.local()
+_output_lock = threading.Lock()
+
+
+class Task:
+    """
+    A build step. The action may return False to signal that there was
+    nothing to do because its outputs were up to date.
+    """
+
+    def __init__(self, name: str, action: Callable[[], Optional[bool]],
+                 deps: Sequence[str] = ()):
+        self.name = name
+        self.action = action
+        self.deps = deps
+        self.status = 'not run'
+        self.duration = 0.0
+
+    def run(self) -> None:
+        _current.task = self
+        start = time.perf_counter()
+        try:
+            with profiling.stage(self.name, 'task'):
+                result = self.action()
+            self.status = 'up to date' if result is False else 'done'
+        except BaseException:
+            self.status = 'failed'
+            raise
+        finally:
+            self.duration = time.perf_counter() - start
+            _current.task = None
+
+
+def run_tasks(tasks: List[Task], jobs: int) -> None:
+    """
+    Run the given tasks, with at most jobs of them running at the same time,
+    each task starting only after all its dependencies succeeded.
+    After a failure, no new task is started and the first error is raised
+    once running tasks are finished.
+    """
+    pending = {task.name: task for task in tasks}
+    finished: List[str] = []
+    running: Dict[Future, Task] = dict()
+    error: Optional[BaseException] = None
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        while True:
+            if error is None:
+                for task in list(pending.values()):
+                    if len(running) < max(jobs, 1) and all(dep in finished for dep in task.deps):
+                        del pending[task.name]
+                        running[pool.submit(task.run)] = task
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                exc = future.exception()
+                if exc is None:
+                    finished.append(task.name)
+                elif error is None:
+                    error = exc
+    if error is not None:
+        raise error
+    if pending:
+        raise RuntimeError(f"Unsatisfiable dependencies for {', '.join(pending)}")
+
+
+def run_command(cmd: str, cwd: Path, capture: bool = False,
+                check: bool = True) -> subprocess.CompletedProcess:
+    """
+    Run a shell command, raising CalledProcessError if it fails and check is
+    True. When called from a task, each line of output is prefixed with the
+    task name. When capture is True, the output (merged with errors) is also
+    stored in the stdout attribute of the result.
+    """
+    profiler = profiling.active()
+    if profiler is None:
+        return _run_command(cmd, cwd, capture, check)
+    start = time.time()
+    try:
+        return _run_command(cmd, cwd, capture, check)
+    finally:
+        profiler.add(cmd, 'subprocess', start, time.time(),
+                     children_peak_rss=profiling.children_peak_rss())
+
+
+def _run_command(cmd: str, cwd: Path, capture: bool,
+                 check: bool) -> subprocess.CompletedProcess:
+    task = getattr(_current, 'task', None)
+    if task is None and not capture:
+        return subprocess.run(cmd, cwd=str(cwd), check=check, shell=True)
+    prefix = f'[{task.name}] ' if task is not None else ''
+    output = []
+    with subprocess.Popen(cmd, cwd=str(cwd), shell=True, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, text=True, errors='replace') as proc:
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            output.append(line)
+            with _output_lock:
+                print(prefix + line, end='', flush=True)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, ''.join(output))
+    return subprocess.CompletedProcess(cmd, proc.returncode, ''.join(output))
+
+
+def print_report(tasks: List[Task], console: Console) -> None:
+    """Print the status and wall time of each task."""
+    table = Table('Step', 'Status', 'Time')
+    for task in tasks:
+        table.add_row(task.name, task.status,
+                      f'{task.duration:.1f}s' if task.status != 'not run' else '')
+    console.print(table)
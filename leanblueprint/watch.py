@@ -0,0 +1,130 @@
+"""
+Watch a folder for file changes.
+
+The watchdog package is used if it is installed, otherwise the folder is
+polled. In both cases, bursts of changes (for instance when an editor saves
+several files, or writes a file in several steps) are grouped: `wait` returns
+only once no change happened for a short while.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from fnmatch import fnmatch
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, Optional, Tuple
+
+# Files which are not sources: plasTeX auxiliary files, hidden files
+# and editor backups.
+IGNORED = ['*.paux', 'web.bbl', '.*', '*~']
+
+
+def ignored(path: Path, root: Path) -> bool:
+    """Tell whether changes to path should be ignored."""
+    return any(fnmatch(part, pattern)
+               for part in path.relative_to(root).parts for pattern in IGNORED)
+
+
+class Watcher(ABC):
+    def __init__(self, root: Path, quiet_period: float = 0.3):
+        self.root = root.resolve()
+        self.quiet_period = quiet_period
+
+    @abstractmethod
+    def poll(self, timeout: Optional[float]) -> bool:
+        """
+        Wait at most timeout seconds (or forever if timeout is None) for a
+        change and tell whether something changed.
+        """
+        pass
+
+    def wait(self) -> None:
+        """
+        Wait for a change, then wait until no further change happens
+        during quiet_period seconds.
+        """
+        self.poll(None)
+        while self.poll(self.quiet_period):
+            pass
+
+    def stop(self) -> None:
+        """Release resources held by the watcher."""
+        pass
+
+
+class PollingWatcher(Watcher):
+    def __init__(self, root: Path, quiet_period: float = 0.3, interval: float = 0.5):
+        super().__init__(root, quiet_period)
+        self.interval = interval
+        self._snapshot = self.snapshot()
+
+    def snapshot(self) -> Dict[Path, Tuple[float, int]]:
+        """Return the modification time and size of each watched file."""
+        result = dict()
+        for path in self.root.rglob('*'):
+            if not ignored(path, self.root):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    # The file was removed since rglob listed it.
+                    continue
+                if S_ISREG(stat.st_mode):
+                    result[path] = (stat.st_mtime, stat.st_size)
+        return result
+
+    def poll(self, timeout: Optional[float]) -> bool:
+        """see `super.poll`"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.snapshot()
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(min(self.interval, self.quiet_period))
+
+
+class WatchdogWatcher(Watcher):
+    def __init__(self, root: Path, quiet_period: float = 0.3):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        super().__init__(root, quiet_period)
+        self._changed = threading.Event()
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ('opened', 'closed_no_write'):
+                    return
+                # Directories are modified when their content changes,
+                # including ignored files.
+                if event.is_directory and event.event_type == 'modified':
+                    return
+                paths = [event.src_path, getattr(event, 'dest_path', '')]
+                if any(path and not ignored(Path(path), watcher.root) for path in paths):
+                    watcher._changed.set()
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(self.root), recursive=True)
+        self._observer.start()
+
+    def poll(self, timeout: Optional[float]) -> bool:
+        """see `super.poll`"""
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def stop(self) -> None:
+        """see `super.stop`"""
+        self._observer.stop()
+        self._observer.join()
+
+
+def make_watcher(root: Path) -> Watcher:
+    """Return a watcher for root, using watchdog if it is installed."""
+    try:
+        return WatchdogWatcher(root)
+    except ImportError:
+        return PollingWatcher(root)